@@ -0,0 +1,101 @@
+# benchmarks/bench_bedrock_client.py
+"""
+Micro-benchmark: per-call overhead of a fresh boto3 client vs the shared,
+pooled client from note2tex.bedrock_llm.
+
+The network is replaced by a local stub (a botocore "before-send" hook that
+returns a canned InvokeModel response), so the numbers only measure client
+construction, request signing and response parsing.
+
+Run from genai_proj/:
+    python -m benchmarks.bench_bedrock_client --calls 200
+"""
+import argparse
+import io
+import json
+import os
+import time
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from note2tex import bedrock_llm
+
+STUB_BODY = json.dumps({"generation": "\\section{Stub}"}).encode("utf-8")
+
+
+class _StubRaw(io.BytesIO):
+    def stream(self, **kwargs):
+        yield self.read()
+
+
+def _stub_send(request, **kwargs):
+    return AWSResponse(request.url, 200, {"content-type": "application/json"}, _StubRaw(STUB_BODY))
+
+
+def _stub_client(config=None):
+    client = boto3.client(
+        "bedrock-runtime",
+        region_name="us-east-1",
+        aws_access_key_id="stub",
+        aws_secret_access_key="stub",
+        config=config,
+    )
+    client.meta.events.register("before-send.bedrock-runtime.InvokeModel", _stub_send)
+    return client
+
+
+def bench_fresh_client(calls, payload):
+    """Old behaviour: build a new client for every request."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        client = _stub_client()
+        response = client.invoke_model(
+            modelId=bedrock_llm.DEFAULT_MODEL,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps(payload)
+        )
+        json.loads(response["body"].read())
+    return (time.perf_counter() - start) / calls
+
+
+def bench_shared_client(calls, payload):
+    """
+    New behaviour: every request reuses bedrock_llm.client_manager's client.
+    Calls the client directly rather than _invoke_bedrock, whose LLM cache
+    and rate limiter would otherwise dominate the timing.
+    """
+    bedrock_llm.client_manager.configure(factory=_stub_client)
+    start = time.perf_counter()
+    for _ in range(calls):
+        response = bedrock_llm.client_manager.get().invoke_model(
+            modelId=bedrock_llm.DEFAULT_MODEL,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps(payload)
+        )
+        json.loads(response["body"].read())
+    elapsed = (time.perf_counter() - start) / calls
+    bedrock_llm.client_manager.configure(factory=None)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bedrock client overhead benchmark")
+    parser.add_argument("--calls", type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_EC2_METADATA_DISABLED", "true")
+    payload = {"prompt": "hello", "temperature": 0.2, "top_p": 0.9, "max_gen_len": 16}
+
+    fresh = bench_fresh_client(args.calls, payload)
+    shared = bench_shared_client(args.calls, payload)
+
+    print(f"fresh client per call : {fresh * 1000:8.3f} ms/call")
+    print(f"shared pooled client  : {shared * 1000:8.3f} ms/call")
+    print(f"speedup               : {fresh / shared:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ __all__ = [
     "section_generator",
     "section_validator",
     "section_refiner",
+    "section_scheduler",
     "latex_assembler",
     "latex_stylist",
     "beautifier_agent",
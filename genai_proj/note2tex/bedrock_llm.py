@@ -3,24 +3,90 @@ import boto3
 import json
 import os
 import time
-import random
+import threading
+from botocore.config import Config
+from .utils.rate_limiter import bedrock_limiter
+from .utils.llm_cache import llm_cache
 
 DEFAULT_MODEL = "meta.llama3-70b-instruct-v1:0"
+# configure() default meaning "leave unchanged", so factory=None can clear a factory
+_UNSET = object()
+
+class BedrockClientManager:
+    """
+    Process-wide owner of the bedrock-runtime client.
+    boto3 clients are thread-safe, so one pooled client (kept-alive HTTPS
+    connections, up to max_pool_connections in flight) is shared by every
+    caller instead of paying credential lookup + TLS handshake per request.
+    """
+
+    def __init__(self, max_pool_connections=None, tcp_keepalive=True, factory=None):
+        self.max_pool_connections = max_pool_connections or int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "16"))
+        self.tcp_keepalive = tcp_keepalive
+        self.factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_pool_connections=None, tcp_keepalive=None, factory=_UNSET):
+        """
+        Change pool settings; the client is rebuilt on next use. factory(config)
+        replaces boto3.client construction; pass factory=None to go back to it.
+        """
+        with self._lock:
+            if max_pool_connections is not None:
+                self.max_pool_connections = max_pool_connections
+            if tcp_keepalive is not None:
+                self.tcp_keepalive = tcp_keepalive
+            if factory is not _UNSET:
+                self.factory = factory
+            self._client = None
+
+    def _build(self):
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+        if self.factory:
+            return self.factory(config)
+        return boto3.client(
+            "bedrock-runtime",
+            region_name=os.getenv("BEDROCK_REGION", "us-east-1"),
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
+            config=config
+        )
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build()
+        return self._client
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+
+client_manager = BedrockClientManager()
+
+def get_bedrock_client():
+    return client_manager.get()
 
 def _invoke_bedrock(payload, model_id):
-    client = boto3.client(
-        "bedrock-runtime",
-        region_name=os.getenv("BEDROCK_REGION", "us-east-1"),
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        aws_session_token=os.getenv("AWS_SESSION_TOKEN")
-    )
+    client = get_bedrock_client()
 
     # If the user passed None explicitly, fallback to default
     if not model_id:
         model_id = DEFAULT_MODEL
 
+    cache_key = llm_cache.make_key(model_id, payload)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     for attempt in range(5):
+        bedrock_limiter.acquire()
         try:
             response = client.invoke_model(
                 modelId=model_id,
@@ -29,17 +95,20 @@ def _invoke_bedrock(payload, model_id):
                 body=json.dumps(payload)
             )
             body = json.loads(response["body"].read())
-            
-            if "generation" in body: return body["generation"]
-            if "output_text" in body: return body["output_text"]
-            if "outputs" in body: return body["outputs"][0]["text"]
-            
-            return str(body)
+            bedrock_limiter.on_success()
+
+            if "generation" in body: text = body["generation"]
+            elif "output_text" in body: text = body["output_text"]
+            elif "outputs" in body: text = body["outputs"][0]["text"]
+            else: text = str(body)
+
+            llm_cache.put(cache_key, text)
+            return text
 
         except client.exceptions.ThrottlingException:
-            wait = (2 ** attempt) + random.uniform(0, 1.5)
-            print(f"⏳ Throttled. Waiting {wait:.1f}s...")
-            time.sleep(wait)
+            # The limiter halves the shared rate; the next acquire() paces the retry
+            bedrock_limiter.on_throttle()
+            print(f"⏳ Throttled. Rate lowered to {bedrock_limiter.rate:.2f} req/s...")
         except Exception as e:
             print(f"⚠️ Bedrock Error ({model_id}): {e}")
             if attempt == 4: raise e
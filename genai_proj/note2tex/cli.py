@@ -1,16 +1,18 @@
 # note2tex/cli.py
 import argparse
 import os
-import time
 import sys
 from pathlib import Path
 
 # Core Modules
 from .section_generator import SectionGenerator
 from .section_validator import SectionValidator
-from .section_refiner import refine_section
+from .section_scheduler import SectionScheduler
 from .latex_assembler import LatexAssembler
 from .latex_stylist import LatexStylist
+from .bedrock_llm import client_manager
+from .utils.rate_limiter import bedrock_limiter
+from .utils.llm_cache import llm_cache
 
 # Optional Extractors
 try: from .ocr import extract_text_from_file
@@ -61,7 +63,9 @@ def main():
     parser.add_argument("--verbosity", default="medium", choices=["tiny", "medium", "long"])
     parser.add_argument("--max_refines", type=int, default=2, help="Max Refiner passes")
     parser.add_argument("--stylist_model", default=None, help="Model ID for final stylist")
-    parser.add_argument("--wait_between_calls", type=float, default=1.0, help="Anti-throttle delay")
+    parser.add_argument("--max_rps", type=float, default=20.0, help="Upper bound on Bedrock requests/sec (adapts down on throttling)")
+    parser.add_argument("--max_workers", type=int, default=4, help="Sections generated concurrently")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached LLM responses (fresh results are still stored)")
     args = parser.parse_args()
 
     OUTDIR = Path("output")
@@ -112,47 +116,26 @@ def main():
         except: pass
 
     # --- 2. Initialization ---
+    # One pooled Bedrock client shared by all workers; leave headroom for the stylist
+    client_manager.configure(max_pool_connections=max(args.max_workers, 1) + 2)
+    if args.no_cache:
+        llm_cache.bypass = True
+    bedrock_limiter.set_rate(min(bedrock_limiter.rate, args.max_rps), max_rate=args.max_rps)
     generator = SectionGenerator(verbosity=args.verbosity)
     validator = SectionValidator()
     assembler = LatexAssembler()
     stylist = LatexStylist(preamble_path=os.path.join("note2tex", "preamble.tex"), model_id=args.stylist_model)
 
-    SECTIONS = [
-        "title_abstract", "problem", "theory", "method", "code",
-        "experiments", "results", "figures", "limitations", "future", "conclusion"
-    ]
-    sections_out = {}
+    scheduler = SectionScheduler(
+        generator, validator,
+        max_refines=args.max_refines,
+        refine_model=args.stylist_model,
+        max_workers=args.max_workers,
+    )
 
-    # --- 3. Generation Loop (Gen -> Val -> Refine) ---
-    print("   [2/5] Generating Sections...")
-    for sec in SECTIONS:
-        print(f"\n   >>> Processing: {sec}")
-        
-        # A. Generator
-        sec_draft = generator.generate(sec, assignment_text, code_text, outputs_text, rag_summary)
-        time.sleep(args.wait_between_calls)
-
-        # B. Validator
-        ok, issues = validator.validate(sec, sec_draft)
-        
-        # C. Refiner (Conditional)
-        attempt = 0
-        while not ok and attempt < args.max_refines:
-            attempt += 1
-            print(f"       ⚠️ Issues: {issues} -> Refining (Attempt {attempt})...")
-            try:
-                sec_draft = refine_section(sec, sec_draft, issues, assignment_text, code_text, outputs_text, rag_summary, model_id=args.stylist_model)
-            except Exception as e:
-                print(f"       ❌ Refiner crashed: {e}")
-                break
-            
-            time.sleep(args.wait_between_calls)
-            ok, issues = validator.validate(sec, sec_draft)
-
-        if ok: print("       ✅ Validated.")
-        else: print(f"       ⚠️ Remaining Issues: {issues}")
-        
-        sections_out[sec] = sec_draft
+    # --- 3. Generation (Gen -> Val -> Refine, sections in parallel) ---
+    print(f"   [2/5] Generating Sections ({args.max_workers} workers)...")
+    sections_out = scheduler.run(assembler.SECTION_ORDER, assignment_text, code_text, outputs_text, rag_summary)
 
     # --- 4. Assembly ---
     print("\n   [3/5] Assembling Body...")
@@ -172,6 +155,7 @@ def main():
     final_path.write_text(final_tex, encoding="utf-8")
     
     print(f"\n🎉 Done! Output saved to: {final_path}")
+    print(f"   {llm_cache.report()}")
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+# note2tex/section_scheduler.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .section_refiner import refine_section
+
+
+class SectionScheduler:
+    """
+    Runs the Gen -> Val -> Refine chain of every section concurrently.
+    Sections do not depend on each other, so each chain is submitted to a
+    thread pool (bounded by max_workers) and the drafts are collected into a
+    dict that LatexAssembler.assemble_body puts back into SECTION_ORDER.
+    """
+
+    def __init__(self, generator, validator, max_refines=2, refine_model=None,
+                 max_workers=4):
+        self.generator = generator
+        self.validator = validator
+        self.max_refines = max_refines
+        self.refine_model = refine_model
+        self.max_workers = max(1, int(max_workers))
+
+    def process_section(self, sec, assignment, code, outputs, rag):
+        """Generate, validate and refine a single section. Returns the final draft."""
+        print(f"\n   >>> Processing: {sec}")
+
+        # A. Generator
+        sec_draft = self.generator.generate(sec, assignment, code, outputs, rag)
+
+        # B. Validator
+        ok, issues = self.validator.validate(sec, sec_draft)
+
+        # C. Refiner (Conditional)
+        attempt = 0
+        while not ok and attempt < self.max_refines:
+            attempt += 1
+            print(f"       ⚠️ [{sec}] Issues: {issues} -> Refining (Attempt {attempt})...")
+            try:
+                sec_draft = refine_section(sec, sec_draft, issues, assignment, code, outputs, rag, model_id=self.refine_model)
+            except Exception as e:
+                print(f"       ❌ [{sec}] Refiner crashed: {e}")
+                break
+
+            ok, issues = self.validator.validate(sec, sec_draft)
+
+        if ok: print(f"       ✅ [{sec}] Validated.")
+        else: print(f"       ⚠️ [{sec}] Remaining Issues: {issues}")
+
+        return sec_draft
+
+    def run(self, sections, assignment, code, outputs, rag):
+        """
+        sections : iterable of section keys
+        Returns {section_key: latex_body_string}. A section whose chain raised
+        is reported and left out, so the assembler simply skips it.
+        """
+        sections_out = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(self.process_section, sec, assignment, code, outputs, rag): sec
+                for sec in sections
+            }
+            for fut in as_completed(futures):
+                sec = futures[fut]
+                try:
+                    sections_out[sec] = fut.result()
+                except Exception as e:
+                    print(f"       ❌ [{sec}] Generation failed: {e}")
+        return sections_out
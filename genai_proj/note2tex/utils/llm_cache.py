@@ -0,0 +1,124 @@
+# note2tex/utils/llm_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class LLMCache:
+    """
+    On-disk, content-addressed cache for LLM responses.
+
+    The key is sha256 over (model_id, request payload) where the payload holds the
+    fully formatted prompt plus generation params, so any prompt or temperature
+    change is a miss. Each entry is one JSON file under <cache_dir>/<aa>/<hash>.json.
+    Hits refresh the file mtime, which makes mtime-ordered eviction an LRU; entries
+    older than max_age seconds are dropped regardless.
+
+    bypass=True skips lookups but still writes fresh results (a forced refresh).
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600,
+                 bypass=False, evict_every=64):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bypass = bypass
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_id, payload):
+        blob = json.dumps({"model_id": model_id, "payload": payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached string or None."""
+        if self.bypass:
+            return None
+        path = self._path(key)
+        try:
+            if self.max_age and time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["response"]
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"response": value, "created": time.time()}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def cached(self, model_id, payload, call):
+        """Return the cached response for (model_id, payload) or run call() and store it."""
+        key = self.make_key(model_id, payload)
+        value = self.get(key)
+        if value is None:
+            value = call()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self.max_age and now - st.st_mtime > self.max_age:
+                    os.remove(path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"LLM cache: {self.hits} hits / {self.misses} misses ({rate:.1f}% hit rate)"
+
+
+# Shared by every Bedrock caller in note2tex
+llm_cache = LLMCache(
+    os.getenv("NOTE2TEX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "note2tex", "llm")),
+    max_bytes=int(os.getenv("NOTE2TEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    max_age=float(os.getenv("NOTE2TEX_CACHE_MAX_AGE", str(30 * 24 * 3600))),
+    bypass=os.getenv("NOTE2TEX_NO_CACHE", "0") == "1",
+)
@@ -0,0 +1,73 @@
+# note2tex/utils/rate_limiter.py
+import os
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe token bucket whose refill rate adapts AIMD-style:
+    - every successful call adds `increase` req/s (up to max_rate)
+    - every ThrottlingException multiplies the rate by `decrease` (down to min_rate)
+    Callers do `acquire()` before a request and report the outcome with
+    `on_success()` / `on_throttle()`, so we probe upwards until Bedrock pushes back.
+    """
+
+    def __init__(self, rate=1.0, burst=2, min_rate=0.05, max_rate=20.0,
+                 increase=0.05, decrease=0.5):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = self.burst
+        self.throttles = 0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            # Concurrent requests tend to get throttled together; back off once per refill interval
+            if now - self._last_decrease < 1.0 / self.rate:
+                return
+            self._last_decrease = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+
+    def set_rate(self, rate, max_rate=None):
+        with self._lock:
+            if max_rate is not None:
+                self.max_rate = max_rate
+            self.rate = max(self.min_rate, min(self.max_rate, float(rate)))
+
+
+# Shared by every Bedrock caller in the process
+bedrock_limiter = AdaptiveRateLimiter(
+    rate=float(os.getenv("BEDROCK_START_RPS", "1.0")),
+    max_rate=float(os.getenv("BEDROCK_MAX_RPS", "20.0")),
+)
@@ -1,14 +1,40 @@
 import json
 import os
+import sys
+import threading
 from typing import Any, Dict
 import boto3
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 
+# Shared helpers (rate limiter, caches) live in the genai_qa root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import bedrock_limiter
+from llm_cache import llm_cache
+
+
+MAX_RETRIES = int(os.getenv("BEDROCK_MAX_RETRIES", "5"))
+
+_client = None
+_client_lock = threading.Lock()
+
 
 def _make_bedrock_client() -> boto3.client:
     """Create a Bedrock Runtime client using environment variables."""
     region = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
-    return boto3.client("bedrock-runtime", region_name=region)
+    # Pool sized for concurrent summarisation workers sharing this client
+    config = Config(max_pool_connections=int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "16")))
+    return boto3.client("bedrock-runtime", region_name=region, config=config)
+
+
+def get_bedrock_client() -> boto3.client:
+    """Process-wide Bedrock Runtime client (boto3 clients are thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _make_bedrock_client()
+    return _client
 
 def invoke_mistral(prompt: str,
                   max_gen_len: int = 1024,
@@ -17,9 +43,9 @@ def invoke_mistral(prompt: str,
     """
     Call the Mistral‑7B‑Instruct model on Amazon Bedrock.
 
-    Returns the generated text (no JSON wrapper).
+    Returns the generated text (no JSON wrapper). Identical requests are
+    answered from the on-disk LLM cache.
     """
-    client = _make_bedrock_client()
     model_id = "mistral.mistral-7b-instruct-v0:2"
 
     # Mistral models on Bedrock expect the prompt wrapped in <s>[INST] ... [/INST]
@@ -31,33 +57,53 @@ def invoke_mistral(prompt: str,
         "top_p": top_p,
     }
 
-    try:
-        response = client.invoke_model(
-            body=json.dumps(payload),
-            modelId=model_id,
-            accept="application/json",
-            contentType="application/json",
-        )
-        body_bytes = response["body"].read()
-        result = json.loads(body_bytes)
-        # Bedrock may return either a top‑level "generation" field or an "outputs" list.
-        if isinstance(result, dict):
-            # Direct generation field (used by some SDK examples)
-            if "generation" in result:
-                return result["generation"].strip()
-            # Older style response with outputs list
-            outputs = result.get("outputs")
-            if isinstance(outputs, list) and outputs:
-                first = outputs[0]
-                if isinstance(first, dict):
-                    # Prefer "text" if present
-                    if "text" in first and isinstance(first["text"], str):
-                        return first["text"].strip()
-                    # Fallback to "completion" or similar keys
-                    for key in ("completion", "generated_text"):
-                        if key in first and isinstance(first[key], str):
-                            return first[key].strip()
-        # If we get here, fall back to raw JSON string for debugging
-        return json.dumps(result)
-    except (BotoCoreError, ClientError) as exc:
-        raise RuntimeError(f"Bedrock call failed: {exc}") from exc
\ No newline at end of file
+    return llm_cache.cached(model_id, payload, lambda: _invoke(model_id, payload))
+
+
+def _invoke(model_id: str, payload: Dict[str, Any]) -> str:
+    """
+    Send one request to Bedrock and extract the generated text. Throttled
+    requests are retried up to MAX_RETRIES times; the shared limiter backs
+    off the request rate on each throttle.
+    """
+    client = get_bedrock_client()
+    for attempt in range(MAX_RETRIES):
+        bedrock_limiter.acquire()
+        try:
+            response = client.invoke_model(
+                body=json.dumps(payload),
+                modelId=model_id,
+                accept="application/json",
+                contentType="application/json",
+            )
+            bedrock_limiter.on_success()
+            return _extract_text(json.loads(response["body"].read()))
+        except (BotoCoreError, ClientError) as exc:
+            throttled = isinstance(exc, ClientError) and exc.response["Error"]["Code"] == "ThrottlingException"
+            if throttled:
+                bedrock_limiter.on_throttle()
+            if not throttled or attempt == MAX_RETRIES - 1:
+                raise RuntimeError(f"Bedrock call failed: {exc}") from exc
+
+
+def _extract_text(result: Any) -> str:
+    """Pull the generated text out of a Bedrock response body."""
+    # Bedrock may return either a top‑level "generation" field or an "outputs" list.
+    if isinstance(result, dict):
+        # Direct generation field (used by some SDK examples)
+        if "generation" in result:
+            return result["generation"].strip()
+        # Older style response with outputs list
+        outputs = result.get("outputs")
+        if isinstance(outputs, list) and outputs:
+            first = outputs[0]
+            if isinstance(first, dict):
+                # Prefer "text" if present
+                if "text" in first and isinstance(first["text"], str):
+                    return first["text"].strip()
+                # Fallback to "completion" or similar keys
+                for key in ("completion", "generated_text"):
+                    if key in first and isinstance(first[key], str):
+                        return first[key].strip()
+    # If we get here, fall back to raw JSON string for debugging
+    return json.dumps(result)
\ No newline at end of file
@@ -1,9 +1,19 @@
+import base64
+import hashlib
+import json
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import nbformat
-from typing import List, Union
+from tqdm import tqdm
+from typing import Any, Dict, List, Optional, Tuple, Union
 from schema import NotebookBlock, CodeBlock, MarkdownBlock, OutputBlock
 from bedrock_client import invoke_mistral
 
+# Concurrent summarisation requests; Bedrock throughput is capped by the shared rate limiter
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+
 
 def summarise_code_block(code: str, outputs_desc: str) -> str:
     """
@@ -26,10 +36,154 @@ def summarise_code_block(code: str, outputs_desc: str) -> str:
     return invoke_mistral(prompt, max_gen_len=512, temperature=0.2, top_p=0.9)
 
 
-def parse_notebook(file_path: str) -> List[Union[CodeBlock, MarkdownBlock]]:
+def latency_histogram(latencies: List[float], edges=(0.5, 1, 2, 4, 8, 16), width: int = 30) -> str:
+    """Text histogram of per-call latencies in seconds."""
+    if not latencies:
+        return "No summarisation calls."
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2]
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    counts = [0] * (len(edges) + 1)
+    for t in latencies:
+        counts[sum(t >= e for e in edges)] += 1
+    labels = [f"< {edges[0]}s"] + [f"{lo}-{hi}s" for lo, hi in zip(edges, edges[1:])] + [f">= {edges[-1]}s"]
+    peak = max(counts)
+    lines = [f"Per-cell summary latency (n={len(latencies)}, p50={p50:.2f}s, p95={p95:.2f}s, max={ordered[-1]:.2f}s):"]
+    for label, n in zip(labels, counts):
+        lines.append(f"  {label:>9} | {'#' * round(width * n / peak):<{width}} {n}")
+    return "\n".join(lines)
+
+
+def summarise_cells(jobs: List[Tuple[str, str]], max_workers: int = SUMMARY_WORKERS) -> List[Optional[str]]:
+    """
+    Summarises (code, outputs_desc) jobs concurrently and returns the summaries
+    in job order. A cell whose summary fails gets None (and is retried on the
+    next incremental parse). Prints a per-cell latency histogram.
+    """
+    summaries: List[Optional[str]] = [None] * len(jobs)
+    latencies: List[float] = []
+    if not jobs:
+        return summaries
+
+    def _run(i):
+        start = time.perf_counter()
+        try:
+            return summarise_code_block(*jobs[i])
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(_run, i): i for i in range(len(jobs))}
+        for fut in tqdm(as_completed(futures), total=len(futures), desc="Summarising code cells"):
+            i = futures[fut]
+            try:
+                summaries[i] = fut.result()
+            except Exception as e:
+                print(f"Summary failed for code cell {i}: {e}")
+
+    print(latency_histogram(latencies))
+    return summaries
+
+
+# Output MIME types stored as files next to the JSON instead of inline base64
+BINARY_MIME_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+
+
+def externalize_output_data(data: Dict[str, Any], asset_dir: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Moves base64 binary payloads out of an output's data dict. Each payload is
+    written once to <asset_dir>/<sha[:2]>/<sha256>.<ext> (content-addressed, so
+    identical plots across cells or runs share a file).
+    Returns (data without the payloads, {mime: path relative to asset_dir's parent}).
+    """
+    kept, files = {}, {}
+    base = os.path.dirname(os.path.abspath(asset_dir))
+    for mime, value in data.items():
+        ext = BINARY_MIME_EXTENSIONS.get(mime)
+        if ext is None or not isinstance(value, str):
+            kept[mime] = value
+            continue
+        raw = base64.b64decode(value)
+        digest = hashlib.sha256(raw).hexdigest()
+        path = os.path.join(asset_dir, digest[:2], digest + ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        files[mime] = os.path.relpath(path, base).replace(os.sep, "/")
+    return kept, files
+
+
+def describe_outputs(outputs: List[OutputBlock]) -> str:
+    """Short textual description of a cell's outputs, fed to the summariser."""
+    outputs_desc_parts = []
+    for output in outputs:
+        out_type = output.output_type
+        if out_type == 'stream':
+            out_text = output.text or ""
+            outputs_desc_parts.append(f"Stream output: {out_text[:200]}{'...' if len(out_text) > 200 else ''}")
+        elif out_type in ('execute_result', 'display_data'):
+            out_data = dict(output.data or {}, **output.files)
+            if out_data:
+                if 'image/png' in out_data or 'image/jpeg' in out_data:
+                    outputs_desc_parts.append("Image output (e.g., plot, chart)")
+                elif 'text/plain' in out_data:
+                    plain_text = out_data['text/plain']
+                    outputs_desc_parts.append(f"Text output: {plain_text[:200]}{'...' if len(plain_text) > 200 else ''}")
+        elif out_type == 'error':
+            outputs_desc_parts.append(f"Error output: {output.text}")
+    return "\n".join(outputs_desc_parts) if outputs_desc_parts else "No significant outputs."
+
+
+def cell_hash(source: str, outputs_desc: str) -> str:
+    """Identity of a code cell for summary reuse: its source plus what its outputs look like."""
+    return hashlib.sha256(f"{source}\0{outputs_desc}".encode("utf-8")).hexdigest()
+
+
+def load_previous_summaries(json_path: str) -> Dict[str, str]:
+    """
+    Reads a previous <notebook>_parsed.json and returns {source_hash: summary}.
+    Files written before source_hash existed are hashed from their stored
+    content and outputs.
+    """
+    if not os.path.exists(json_path):
+        return {}
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except Exception as e:
+        print(f"Could not read previous parse {json_path}: {e}")
+        return {}
+
+    summaries = {}
+    for blk in previous:
+        if blk.get("cell_type") != "code" or not blk.get("summary"):
+            continue
+        h = blk.get("source_hash")
+        if not h:
+            outputs = [OutputBlock(**o) for o in blk.get("outputs", [])]
+            h = cell_hash(blk.get("content", ""), describe_outputs(outputs))
+        summaries[h] = blk["summary"]
+    return summaries
+
+
+def parse_notebook(file_path: str, previous_summaries: Optional[Dict[str, str]] = None,
+                   max_workers: int = SUMMARY_WORKERS,
+                   asset_dir: Optional[str] = None) -> List[Union[CodeBlock, MarkdownBlock]]:
     """
     Parses a Jupyter notebook file and returns a list of typed blocks.
+
+    previous_summaries ({source_hash: summary}, see load_previous_summaries)
+    lets unchanged code cells keep their summary; only new or edited cells
+    are sent to the summariser, max_workers at a time.
+    With asset_dir, image outputs are written there and referenced from
+    OutputBlock.files instead of being kept inline as base64.
     """
+    previous_summaries = previous_summaries or {}
+    reused = 0
+    pending: List[Tuple[CodeBlock, str]] = []
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             nb = nbformat.read(f, as_version=4)
@@ -50,7 +204,6 @@ def parse_notebook(file_path: str) -> List[Union[CodeBlock, MarkdownBlock]]:
         elif cell.cell_type == 'code':
             # Process outputs
             processed_outputs = []
-            outputs_desc_parts = []
             for output in cell.get('outputs', []):
                 out_type = output.output_type
                 out_text = None
@@ -58,61 +211,86 @@ def parse_notebook(file_path: str) -> List[Union[CodeBlock, MarkdownBlock]]:
 
                 if out_type == 'stream':
                     out_text = output.text
-                    outputs_desc_parts.append(f"Stream output: {out_text[:200]}{'...' if len(out_text) > 200 else ''}")
                 elif out_type in ('execute_result', 'display_data'):
                     out_data = output.data
-                    if out_data:
-                        if 'image/png' in out_data or 'image/jpeg' in out_data:
-                            outputs_desc_parts.append("Image output (e.g., plot, chart)")
-                        elif 'text/plain' in out_data:
-                            plain_text = out_data['text/plain']
-                            outputs_desc_parts.append(f"Text output: {plain_text[:200]}{'...' if len(plain_text) > 200 else ''}")
                 elif out_type == 'error':
                     out_text = f"{output.ename}: {output.evalue}"
-                    outputs_desc_parts.append(f"Error output: {out_text}")
+
+                out_files = {}
+                if out_data and asset_dir:
+                    out_data, out_files = externalize_output_data(out_data, asset_dir)
 
                 processed_outputs.append(OutputBlock(
                     output_type=out_type,
                     text=out_text,
-                    data=out_data
+                    data=out_data,
+                    files=out_files
                 ))
 
-            outputs_desc = "\n".join(outputs_desc_parts) if outputs_desc_parts else "No significant outputs."
+            outputs_desc = describe_outputs(processed_outputs)
+            source_hash = cell_hash(cell.source, outputs_desc)
 
-            # Generate a summary for the code block before creating the model
-            code_summary = summarise_code_block(cell.source, outputs_desc)
+            # Reuse the previous summary if neither the code nor its outputs changed
+            code_summary = previous_summaries.get(source_hash)
+            if code_summary:
+                reused += 1
 
             block = CodeBlock(
                 content=cell.source,
                 metadata=cell.metadata,
                 outputs=processed_outputs,
-                summary=code_summary
+                summary=code_summary,
+                source_hash=source_hash
             )
             parsed_blocks.append(block)
+            if not code_summary:
+                pending.append((block, outputs_desc))
 
+    # Summarise the remaining cells concurrently; results map back by position
+    summaries = summarise_cells([(blk.content, desc) for blk, desc in pending], max_workers=max_workers)
+    for (blk, _), summary in zip(pending, summaries):
+        blk.summary = summary
+
+    if previous_summaries:
+        n_code = sum(isinstance(b, CodeBlock) for b in parsed_blocks)
+        print(f"Reused {reused}/{n_code} code cell summaries from the previous parse.")
     return parsed_blocks
 
 
+def save_parsed_notebook(notebook_path: str, output_path: Optional[str] = None,
+                         full: bool = False) -> List[Union[CodeBlock, MarkdownBlock]]:
+    """
+    Parses notebook_path into output_path (default <notebook>_parsed.json),
+    reusing summaries of unchanged cells from an existing output unless full.
+    Image outputs go to <notebook name>_assets/ next to the JSON.
+    """
+    output_path = output_path or os.path.splitext(notebook_path)[0] + "_parsed.json"
+    previous = {} if full else load_previous_summaries(output_path)
+    asset_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)),
+                             os.path.splitext(os.path.basename(notebook_path))[0] + "_assets")
+    blocks = parse_notebook(notebook_path, previous_summaries=previous, asset_dir=asset_dir)
+    print(f"Parsed {len(blocks)} blocks.")
+
+    with open(output_path, "w", encoding="utf-8") as jf:
+        # Pydantic models expose a .dict() method that converts them to plain dicts
+        json.dump([b.dict() for b in blocks], jf, ensure_ascii=False, indent=2)
+    print(f"Saved full parsed content to {output_path}")
+    return blocks
+
+
 if __name__ == "__main__":
     # Simple test that also saves everything to JSON
-    if len(sys.argv) > 1:
-        notebook_path = sys.argv[1]
-
-        # Parse the notebook
-        blocks = parse_notebook(notebook_path)
-        print(f"Parsed {len(blocks)} blocks.")
-
-        # ----- Save all blocks to a JSON file -----
-        import json, os
-        # Create a filename like <notebook_name>_parsed.json
-        output_path = os.path.splitext(notebook_path)[0] + "_parsed.json"
-        with open(output_path, "w", encoding="utf-8") as jf:
-            # Pydantic models expose a .dict() method that converts them to plain dicts
-            json.dump([b.dict() for b in blocks], jf, ensure_ascii=False, indent=2)
-        print(f"Saved full parsed content to {output_path}")
+    # Usage: python notebook_parser.py <notebook.ipynb> [--full]
+    # Re-runs reuse summaries of unchanged cells from <notebook>_parsed.json; --full re-summarises everything.
+    # Image outputs go to <notebook>_assets/ and the JSON only references them.
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if args:
+        notebook_path = args[0]
+        # Parse the notebook and save all blocks to <notebook_name>_parsed.json
+        blocks = save_parsed_notebook(notebook_path, full="--full" in sys.argv)
 
         # ----- Generate high‑level markdown summary -----
-        import ast, os
+        import ast
         
         md_lines = []
         md_lines.append(f"# Notebook Summary: {os.path.basename(notebook_path)}\n")
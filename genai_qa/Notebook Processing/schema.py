@@ -10,6 +10,8 @@ class CodeBlock(NotebookBlock):
     cell_type: str = "code"
     outputs: List["OutputBlock"] = Field(default_factory=list)
     summary: Optional[str] = None
+    # sha256 of source + outputs description; lets re-parses reuse the summary
+    source_hash: Optional[str] = None
 
 class MarkdownBlock(NotebookBlock):
     cell_type: str = "markdown"
@@ -18,3 +20,6 @@ class OutputBlock(BaseModel):
     output_type: str
     text: Optional[str] = None
     data: Optional[Dict[str, Any]] = None
+    # Binary outputs written out of the JSON: MIME type -> path of the file,
+    # relative to the directory holding the _parsed.json
+    files: Dict[str, str] = Field(default_factory=dict)
@@ -0,0 +1,232 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "embeddings"))
+
+
+class LazyHFEmbeddings(Embeddings):
+    """
+    HuggingFaceEmbeddings that only loads the sentence-transformers model on
+    the first embed call, so opening an index (or finding nothing to re-embed)
+    never pays the model start-up.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+
+                    print(f"Loading embedding model ({self.model_name})...")
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache for one model.
+
+    Vectors live in <cache_dir>/<model>/vectors.f32, a float32 array of
+    shape (capacity, dim) that is memory-mapped and grown by doubling.
+    index.json maps sha256(text) to [row, last_used tick]. When max_entries
+    is reached the least recently used tenth of the entries is evicted and
+    their rows are reused. Writes come from one process at a time; the index
+    is saved after every batch of new vectors and at exit.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = CACHE_DIR, max_entries: int = 100_000, bypass: bool = False):
+        self.dir = os.path.join(cache_dir, model_name.replace("/", "_"))
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._vectors = None
+        self.dim = None
+        self.capacity = 0
+        self.tick = 0
+        self.entries: Dict[str, List[int]] = {}
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.dir, "index.json")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.dir, "vectors.f32")
+
+    def _load(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            dim, capacity = int(state["dim"]), int(state["capacity"])
+            if os.path.getsize(self._vectors_path) < dim * capacity * 4:
+                raise ValueError("vector file shorter than index")
+        except (OSError, ValueError, KeyError):
+            return
+        self.dim, self.capacity = dim, capacity
+        self.tick = int(state.get("tick", 0))
+        self.entries = {k: list(v) for k, v in state["entries"].items()}
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+
+    def _grow(self, needed: int):
+        """Make room for at least `needed` rows."""
+        new_capacity = max(needed, min(self.max_entries, max(1024, 2 * self.capacity)))
+        os.makedirs(self.dir, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def _free_rows(self, count: int) -> List[int]:
+        """Rows available for `count` new vectors, evicting LRU entries if the cache is full."""
+        used = {row for row, _ in self.entries.values()}
+        free = [r for r in range(self.capacity) if r not in used][:count]
+        if len(free) < count and self.capacity < self.max_entries:
+            self._grow(min(self.max_entries, len(self.entries) + count))
+            free = [r for r in range(self.capacity) if r not in used][:count]
+        if len(free) < count:
+            n_evict = max(count - len(free), self.max_entries // 10)
+            for key, (row, _) in sorted(self.entries.items(), key=lambda kv: kv[1][1])[:n_evict]:
+                del self.entries[key]
+                free.append(row)
+        return free[:count]
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        out = []
+        with self._lock:
+            for key in keys:
+                entry = None if self.bypass else self.entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.tick += 1
+                entry[1] = self.tick
+                # Recency is part of the index: persist it so eviction stays LRU
+                self._dirty = True
+                self.hits += 1
+                out.append(np.array(self._vectors[entry[0]]))
+        return out
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                return
+            # Duplicate texts in one batch share a row
+            todo = {k: v for k, v in zip(keys, vectors) if k not in self.entries}
+            count = min(len(todo), self.max_entries)
+            rows = self._free_rows(count)
+            for (key, vec), row in zip(list(todo.items())[:count], rows):
+                self._vectors[row] = vec
+                self.tick += 1
+                self.entries[key] = [row, self.tick]
+            self._dirty = True
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty or self._vectors is None:
+                return
+            self._vectors.flush()
+            tmp = f"{self._index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "capacity": self.capacity, "tick": self.tick, "entries": self.entries}, f)
+            os.replace(tmp, self._index_path)
+            self._dirty = False
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"Embedding cache: {self.hits} hits / {self.misses} misses ({rate:.1f}% hit rate)"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that answers repeated texts from an EmbeddingCache and
+    sends only the misses, in one batch, to the wrapped model.
+    """
+
+    def __init__(self, inner: Embeddings, cache: EmbeddingCache):
+        self.inner = inner
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.make_key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        # One model call per distinct missing text
+        missing = {}
+        for i, v in enumerate(found):
+            if v is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            computed = np.asarray(self.inner.embed_documents([texts[i] for i in missing.values()]), dtype=np.float32)
+            self.cache.put_many(list(missing), computed)
+            by_key = dict(zip(missing, computed))
+            found = [by_key[k] if v is None else v for k, v in zip(keys, found)]
+        return [v.tolist() for v in found]
+
+    def embed_query(self, text: str) -> List[float]:
+        # MiniLM embeds queries and documents identically, so both share the cache
+        return self.embed_documents([text])[0]
+
+    def report(self):
+        return self.cache.report()
+
+
+_shared: Dict[str, CachedEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def cached_embeddings(model_name: str = EMBEDDING_MODEL) -> CachedEmbeddings:
+    """
+    Lazily loaded model behind the shared on-disk embedding cache. One
+    instance per model and process: index builds and retrievers running side
+    by side (e.g. batch jobs) share the loaded model and the cache's lock.
+    """
+    with _shared_lock:
+        if model_name not in _shared:
+            cache = EmbeddingCache(
+                model_name,
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+                bypass=os.getenv("EMBEDDING_CACHE_BYPASS", "0") == "1",
+            )
+            _shared[model_name] = CachedEmbeddings(LazyHFEmbeddings(model_name), cache)
+        return _shared[model_name]
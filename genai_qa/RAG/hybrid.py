@@ -0,0 +1,129 @@
+import ast
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Code cells longer than this are split into chunks
+CHUNK_CHARS = 1200
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?")
+
+
+def _statement_start(node) -> int:
+    """First line of a top-level statement, decorators included (1-based)."""
+    lines = [node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]
+    return min(lines)
+
+
+def chunk_code(source: str, max_chars: int = CHUNK_CHARS) -> List[str]:
+    """
+    Splits a code cell on top-level statement boundaries. Every function and
+    class definition becomes its own chunk; runs of other statements are
+    packed together up to max_chars. Comments and blank lines stay with the
+    statement that follows them. Cells that do not parse (IPython magics,
+    shell escapes) are split on blank lines instead.
+    """
+    if len(source) <= max_chars:
+        return [source]
+    lines = source.splitlines(keepends=True)
+    try:
+        body = ast.parse(source).body
+    except SyntaxError:
+        body = None
+
+    if body:
+        starts, prev_end = [], 0
+        for n in body:
+            # Pull in the comments and blank lines between the previous statement and this one
+            start = _statement_start(n) - 1
+            while start > prev_end and (not lines[start - 1].strip() or lines[start - 1].lstrip().startswith("#")):
+                start -= 1
+            starts.append(start)
+            prev_end = n.end_lineno
+        starts[0] = 0
+        bounds = starts + [len(lines)]
+        segments = [("".join(lines[a:b]), isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)))
+                    for n, a, b in zip(body, bounds[:-1], bounds[1:])]
+    else:
+        segments = [(p + "\n\n", False) for p in re.split(r"\n\s*\n", source) if p.strip()]
+
+    chunks, buf = [], ""
+    for text, is_def in segments:
+        if is_def or len(buf) + len(text) > max_chars:
+            if buf.strip():
+                chunks.append(buf.strip("\n"))
+            buf = ""
+        if is_def:
+            chunks.append(text.strip("\n"))
+        else:
+            buf += text
+    if buf.strip():
+        chunks.append(buf.strip("\n"))
+    return chunks or [source]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word/number tokens; snake_case identifiers also yield their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        if "_" in tok:
+            tokens.extend(p for p in tok.split("_") if p)
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(texts)
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(self.n_docs, dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                self.postings[term].append((doc, tf))
+        self.avg_len = float(lengths.mean()) if self.n_docs else 0.0
+        # Per-document length normalisation term of the BM25 denominator
+        self._norm = k1 * (1 - b + b * lengths / (self.avg_len or 1.0))
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            docs = np.fromiter((d for d, _ in posting), dtype=np.int64, count=len(posting))
+            tf = np.fromiter((t for _, t in posting), dtype=np.float32, count=len(posting))
+            scores[docs] += self.idf(term) * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        scores = self.scores(query)
+        if not self.n_docs:
+            return []
+        k = min(k, self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(d), float(scores[d])) for d in top if scores[d] > 0]
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Reciprocal rank fusion: each ranking contributes 1 / (k + rank) for every
+    document it lists. Returns (doc, fused score) pairs, best first.
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[doc] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Sequence
+
+import faiss
+import numpy as np
+
+FORMAT = "genai-qa-faiss-v1"
+MANIFEST = "manifest.json"
+INDEX_FILE = "index.faiss"
+# Columnar doc store: each column is a UTF-8 blob plus an int64 offsets table
+COLUMNS = ("id", "text", "metadata")
+
+
+def _write_column(path: str, name: str, values: Sequence[str]):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+    with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+        for b in encoded:
+            f.write(b)
+
+
+class _Column:
+    """Read-only string column over a memory-mapped blob; rows are decoded on access."""
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(path, f"{name}.bin")
+        # np.memmap cannot map an empty file
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+
+
+def write_index(path: str, index, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+    """
+    Writes an index directory: the raw FAISS index, one column per doc field
+    and a manifest. Row i of every column belongs to vector i of the index.
+    The directory is built next to path and swapped in, so readers never see
+    a half-written index and a failed write leaves the old one intact.
+    """
+    if not (index.ntotal == len(ids) == len(texts) == len(metadatas)):
+        raise ValueError("index, ids, texts and metadatas must have the same length")
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(parent, f".{os.path.basename(path)}.tmp-{os.getpid()}")
+    old_path = os.path.join(parent, f".{os.path.basename(path)}.old-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    faiss.write_index(index, os.path.join(tmp_path, INDEX_FILE))
+    _write_column(tmp_path, "id", ids)
+    _write_column(tmp_path, "text", texts)
+    _write_column(tmp_path, "metadata", [json.dumps(m, ensure_ascii=False, sort_keys=True) for m in metadatas])
+    with open(os.path.join(tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT, "count": len(ids), "dim": index.d, "columns": list(COLUMNS)}, f)
+
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def is_native_index(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST))
+
+
+class IndexStore:
+    """
+    Native, pickle-free index directory opened read-only. The FAISS index is
+    memory-mapped where the FAISS build supports it, and documents are
+    decoded from the mmap'd columns one row at a time, so opening is cheap
+    and resident memory tracks what is actually read.
+    """
+
+    def __init__(self, path: str):
+        manifest_path = os.path.join(path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            if os.path.exists(os.path.join(path, "index.pkl")):
+                raise FileNotFoundError(
+                    f"{path} is a legacy pickle index; convert it with "
+                    f"`python RAG/rag_implementation.py migrate` or rebuild it")
+            raise FileNotFoundError(f"RAG index not found at {path}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported index format {self.manifest.get('format')!r} in {path}")
+
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        try:
+            self.index = faiss.read_index(index_path, getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP))
+        except RuntimeError:
+            # Index types without mmap support are read into memory
+            self.index = faiss.read_index(index_path)
+        self._columns = {name: _Column(path, name) for name in COLUMNS}
+
+    def __len__(self):
+        return len(self._columns["id"])
+
+    def doc_id(self, i: int) -> str:
+        return self._columns["id"][i]
+
+    def ids(self) -> List[str]:
+        return [self.doc_id(i) for i in range(len(self))]
+
+    def text(self, i: int) -> str:
+        return self._columns["text"][i]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return json.loads(self._columns["metadata"][i])
+
+    def document(self, i: int):
+        from langchain_core.documents import Document
+
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def vectors(self, rows: Sequence[int]) -> np.ndarray:
+        """Stored vectors for the given rows (flat indexes only)."""
+        if not len(rows):
+            return np.empty((0, self.index.d), dtype=np.float32)
+        return self.index.reconstruct_batch(np.asarray(rows, dtype=np.int64)).astype(np.float32)
+
+    def search(self, vectors: np.ndarray, k: int):
+        return self.index.search(np.ascontiguousarray(vectors, dtype=np.float32), k)
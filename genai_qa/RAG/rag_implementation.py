@@ -1,34 +1,83 @@
+import hashlib
 import json
 import os
 import sys
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
 from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from embeddings import LazyHFEmbeddings, cached_embeddings
+from hybrid import CHUNK_CHARS, chunk_code
+from index_store import IndexStore, is_native_index, write_index
+from retriever import get_retriever
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARSED_JSON_PATH = os.path.join(BASE_DIR, "../Jupyter file/ans_parsed.json")
 VECTOR_DB_PATH = os.path.join(BASE_DIR, "faiss_index")
 
+def iter_parsed_blocks(file_path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the blocks of a parsed-notebook JSON array one at a time, so only
+    the block being decoded (not the whole file) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{file_path} is not a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            # Skip separators between elements
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("buffer exhausted", buf, pos)
+                block, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Element spans the buffer end: read more (doubling, so huge blocks stay linear)
+                more = f.read(max(chunk_size, len(buf) - pos))
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield block
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
 def load_parsed_data(file_path: str) -> List[Dict[str, Any]]:
     """Loads the parsed notebook data from JSON."""
     if not os.path.exists(file_path):
         print(f"Error: File not found at {file_path}")
         return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return list(iter_parsed_blocks(file_path))
 
-def create_documents(parsed_blocks: List[Dict[str, Any]]) -> List[Document]:
+def create_documents(parsed_blocks: Iterable[Dict[str, Any]], chunk_chars: Optional[int] = CHUNK_CHARS) -> List[Document]:
     """
     Converts parsed blocks into LangChain Documents.
     
     Strategy:
     - CodeBlock: Content = Summary + "\n\nCode:\n" + Content. Metadata = type, outputs.
+      Cells longer than chunk_chars are split on function/statement boundaries
+      (hybrid.chunk_code), one document per chunk, each keeping the cell summary.
     - MarkdownBlock: Content = Content. Metadata = type.
+    Every document also records the markdown heading path it sits under
+    (e.g. "Q1 / Part a") as metadata["section"].
     """
     documents = []
+    headings: List[Tuple[int, str]] = []
     for block in parsed_blocks:
         cell_type = block.get("cell_type")
         content = block.get("content", "")
@@ -37,20 +86,30 @@ def create_documents(parsed_blocks: List[Dict[str, Any]]) -> List[Document]:
         # Ensure metadata is a flat dict for compatibility with some vector stores
         # though FAISS handles dicts reasonably well, keeping it simple is safer.
         doc_metadata = {"cell_type": cell_type}
+
+        if cell_type == "markdown" and content.lstrip().startswith("#"):
+            heading = content.strip().splitlines()[0]
+            level = len(heading) - len(heading.lstrip("#"))
+            headings = [h for h in headings if h[0] < level] + [(level, heading.lstrip("#").strip())]
+        doc_metadata["section"] = " / ".join(title for _, title in headings)
         
         if cell_type == "code":
             summary = block.get("summary", "")
             outputs = block.get("outputs", [])
             
-            # Construct rich text for embedding
-            # We prioritize the summary as it contains the semantic meaning
-            text_to_embed = f"Summary: {summary}\n\nCode:\n{content}"
-            
             # Add output info to metadata (simplified)
             doc_metadata["has_outputs"] = len(outputs) > 0
             doc_metadata["summary"] = summary # Store summary in metadata for retrieval display
-            
-            documents.append(Document(page_content=text_to_embed, metadata=doc_metadata))
+
+            chunks = chunk_code(content, chunk_chars) if chunk_chars else [content]
+            for i, chunk in enumerate(chunks):
+                # Construct rich text for embedding
+                # We prioritize the summary as it contains the semantic meaning
+                text_to_embed = f"Summary: {summary}\n\nCode:\n{chunk}"
+                chunk_metadata = dict(doc_metadata)
+                if len(chunks) > 1:
+                    chunk_metadata.update(chunk=i, n_chunks=len(chunks))
+                documents.append(Document(page_content=text_to_embed, metadata=chunk_metadata))
             
         elif cell_type == "markdown":
             # Markdown is already text
@@ -58,43 +117,111 @@ def create_documents(parsed_blocks: List[Dict[str, Any]]) -> List[Document]:
             
     return documents
 
-def build_rag_database(json_path: str = PARSED_JSON_PATH, db_path: str = VECTOR_DB_PATH):
-    """Builds and saves the FAISS vector database."""
+def document_id(doc: Document) -> str:
+    """Stable ID of a document: sha256 over its text and metadata."""
+    blob = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def build_rag_database(json_path: str = PARSED_JSON_PATH, db_path: str = VECTOR_DB_PATH, incremental: bool = True,
+                       chunk_chars: Optional[int] = CHUNK_CHARS):
+    """
+    Builds and saves the vector database in the native index format
+    (see index_store.py).
+
+    Every document is stored under its content-hash ID (document_id). With
+    incremental=True and an existing index, vectors of unchanged documents
+    are copied over, only documents whose ID is new are embedded, IDs no
+    longer produced are dropped, and nothing is rewritten if the set of IDs
+    is unchanged.
+    """
     print(f"Loading data from {json_path}...")
-    data = load_parsed_data(json_path)
-    if not data:
+    if not os.path.exists(json_path):
+        print(f"Error: File not found at {json_path}")
         return
 
+    # Blocks are streamed straight into documents; the raw JSON is never held whole
     print("Creating documents...")
-    docs = create_documents(data)
+    docs = create_documents(iter_parsed_blocks(json_path), chunk_chars=chunk_chars)
+    if not docs:
+        return
     print(f"Created {len(docs)} documents.")
 
-    print("Initializing HuggingFace Embeddings (all-MiniLM-L6-v2)...")
-    # This will download the model locally if not present
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    # Identical cells collapse onto one ID; keep the first occurrence
+    by_id = {}
+    for doc in docs:
+        by_id.setdefault(document_id(doc), doc)
+    ids = list(by_id)
+
+    start = time.perf_counter()
+    # The model is only loaded if something is neither in the index nor in the embedding cache
+    embeddings = cached_embeddings()
+
+    old_rows = {}
+    old = None
+    if incremental and is_native_index(db_path):
+        old = IndexStore(db_path)
+        old_rows = {doc_id: row for row, doc_id in enumerate(old.ids())}
+        n_new = sum(i not in old_rows for i in ids)
+        n_stale = sum(i not in by_id for i in old_rows)
+        print(f"Incremental update: {n_new} new, {n_stale} stale, {len(old_rows) - n_stale} unchanged.")
+        if not n_new and not n_stale and ids == list(old_rows):
+            print("Index is up to date.")
+            return
+
+    new_ids = [i for i in ids if i not in old_rows]
+    print(f"Embedding {len(new_ids)} documents...")
+    fresh = dict(zip(new_ids, embeddings.embed_documents([by_id[i].page_content for i in new_ids]))) if new_ids else {}
+    reused = old.vectors([old_rows[i] for i in ids if i in old_rows]) if old is not None else None
+
+    vectors, r = [], 0
+    for i in ids:
+        if i in old_rows:
+            vectors.append(reused[r])
+            r += 1
+        else:
+            vectors.append(np.asarray(fresh[i], dtype=np.float32))
+    vectors = np.vstack(vectors).astype(np.float32)
 
-    print("Building FAISS index...")
-    vector_db = FAISS.from_documents(docs, embeddings)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
 
     print(f"Saving index to {db_path}...")
-    vector_db.save_local(db_path)
-    print("Done!")
+    write_index(db_path, index, ids,
+                [by_id[i].page_content for i in ids],
+                [by_id[i].metadata for i in ids])
+    print(embeddings.report())
+    print(f"Done in {time.perf_counter() - start:.2f}s!")
+
+def migrate_legacy_index(db_path: str = VECTOR_DB_PATH):
+    """
+    One-off conversion of a LangChain FAISS.save_local directory (index.faiss +
+    pickled index.pkl) into the native format. This is the only place that
+    unpickles, so only run it on an index you built yourself.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    print(f"Converting legacy index at {db_path}...")
+    vector_db = FAISS.load_local(db_path, LazyHFEmbeddings(), allow_dangerous_deserialization=True)
+    n = vector_db.index.ntotal
+    ids = [vector_db.index_to_docstore_id[row] for row in range(n)]
+    docs = [vector_db.docstore.search(doc_id) for doc_id in ids]
+    write_index(db_path, vector_db.index, ids,
+                [d.page_content for d in docs],
+                [d.metadata for d in docs])
+    print(f"Wrote {n} documents in the native format.")
 
 def query_rag(query: str, db_path: str = VECTOR_DB_PATH, k: int = 3):
-    """Queries the existing FAISS database."""
+    """Queries the existing vector database."""
     if not os.path.exists(db_path):
         print(f"Index not found at {db_path}. Please build it first.")
         return
 
-    print("Loading embeddings and index...")
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vector_db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+    # Model and index are loaded on the first query and reused afterwards
+    results = get_retriever(db_path).similarity_search(query, k=k)
 
     print(f"\nQuery: {query}")
     print("-" * 40)
     
-    results = vector_db.similarity_search(query, k=k)
-    
     for i, doc in enumerate(results):
         print(f"\nResult {i+1}:")
         print(f"Type: {doc.metadata.get('cell_type')}")
@@ -108,13 +235,16 @@ if __name__ == "__main__":
     if len(sys.argv) > 1:
         cmd = sys.argv[1]
         if cmd == "build":
-            build_rag_database()
+            build_rag_database(incremental="--full" not in sys.argv)
+        elif cmd == "migrate":
+            migrate_legacy_index()
         elif cmd == "query" and len(sys.argv) > 2:
             query_text = " ".join(sys.argv[2:])
             query_rag(query_text)
         else:
             print("Usage:")
-            print("  python rag_implementation.py build")
+            print("  python rag_implementation.py build [--full]")
+            print("  python rag_implementation.py migrate")
             print("  python rag_implementation.py query 'Your question here'")
     else:
         # Default behavior if no args: build then test query
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Sibling modules (embeddings, index_store) are imported lazily from here
+sys.path.append(BASE_DIR)
+
+VECTOR_DB_PATH = os.path.join(BASE_DIR, "faiss_index")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_PORT = 8765
+# "vector", "hybrid" (vector + BM25 fused with RRF) or "bm25". Vector stays the
+# default until benchmarks/bench_retrieval.py has been run with MiniLM for hybrid
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+# Each ranker contributes this many candidates per requested result to the fusion
+CANDIDATES_PER_RESULT = 4
+
+
+class Retriever:
+    """
+    Long-lived retriever: the MiniLM embedding model and the native index
+    (index_store.IndexStore, no pickle) are loaded once (lazily, on first
+    search) and stay resident for the life of the process. Queries are
+    embedded in one batched forward pass and searched with a single FAISS call.
+    In hybrid mode an in-memory BM25 index over the same documents (built on
+    first use) is queried too, and both rankings are merged with reciprocal
+    rank fusion. A rebuild of db_path (a new manifest.json) is picked up on
+    the next search.
+    """
+
+    def __init__(self, db_path: str = VECTOR_DB_PATH, model_name: str = EMBEDDING_MODEL):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.embeddings = None
+        self.store = None
+        self.bm25 = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _index_version(self):
+        """Identity of the index on disk: write_index swaps in a new directory, hence a new manifest."""
+        from index_store import MANIFEST
+
+        try:
+            st = os.stat(os.path.join(self.db_path, MANIFEST))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def load(self):
+        version = self._index_version()
+        if self.store is not None and version == self._version:
+            return self.store
+        with self._lock:
+            if self.store is None or version != self._version:
+                from embeddings import cached_embeddings
+                from index_store import IndexStore
+
+                print(f"Loading index from {self.db_path}...")
+                store = IndexStore(self.db_path)
+                # Repeated question texts are served from the shared embedding cache
+                self.embeddings = cached_embeddings(self.model_name)
+                self.store, self.bm25, self._version = store, None, version
+            return self.store
+
+    def _bm25(self, store):
+        """BM25 over store's documents, rebuilt when the store was reloaded."""
+        with self._lock:
+            if self.bm25 is None or self.bm25[0] is not store:
+                from hybrid import BM25Index
+
+                self.bm25 = (store, BM25Index([store.text(i) for i in range(len(store))]))
+            return self.bm25[1]
+
+    def search(self, queries: List[str], k: int = 3, mode: str = None):
+        """
+        Returns one list of (Document, score) pairs per query, best first.
+        The score is the L2 distance in "vector" mode (lower is better), the
+        BM25 score in "bm25" mode and the fused RRF score in "hybrid" mode
+        (higher is better).
+        """
+        import numpy as np
+
+        mode = mode or RETRIEVAL_MODE
+        if mode not in ("hybrid", "vector", "bm25"):
+            raise ValueError(f"Unknown retrieval mode {mode!r}")
+        if not queries:
+            return []
+        store = self.load()
+        n_candidates = k if mode == "vector" else max(k * CANDIDATES_PER_RESULT, 20)
+
+        if mode != "bm25":
+            vectors = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+            distances, indices = store.search(vectors, n_candidates)
+
+        results = []
+        for q, query in enumerate(queries):
+            if mode == "vector":
+                ranked = [(int(i), float(d)) for d, i in zip(distances[q], indices[q]) if i != -1]
+            elif mode == "bm25":
+                ranked = self._bm25(store).search(query, k)
+            else:
+                from hybrid import rrf_fuse
+
+                dense = [int(i) for i in indices[q] if i != -1]
+                sparse = [doc for doc, _ in self._bm25(store).search(query, n_candidates)]
+                ranked = rrf_fuse([dense, sparse])
+            results.append([(store.document(doc), score) for doc, score in ranked[:k]])
+        return results
+
+    def report(self):
+        return self.embeddings.report() if self.embeddings is not None else "Embedding cache: unused"
+
+    def similarity_search(self, query: str, k: int = 4):
+        """Same call shape as FAISS.similarity_search."""
+        return [doc for doc, _ in self.search([query], k)[0]]
+
+    def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        """
+        Serve searches over HTTP: POST /search {"queries": [...], "k": 3, "mode": "hybrid"}
+        -> {"results": [[{"page_content", "metadata", "score"}, ...], ...]}
+        """
+        store = self.load()
+        # Load the model and BM25 index now so the first request does not pay for them
+        self.embeddings.inner.model
+        self._bm25(store)
+        retriever = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/search":
+                    self.send_error(404)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    req = json.loads(self.rfile.read(length) or b"{}")
+                    hits = retriever.search(req.get("queries", []), int(req.get("k", 3)), req.get("mode"))
+                    payload = {"results": [
+                        [{"page_content": d.page_content, "metadata": d.metadata, "score": s} for d, s in row]
+                        for row in hits
+                    ]}
+                    body = json.dumps(payload).encode("utf-8")
+                    self.send_response(200)
+                except Exception as e:
+                    body = json.dumps({"error": str(e)}).encode("utf-8")
+                    self.send_response(500)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        print(f"RAG retriever listening on http://{host}:{port}/search")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+class RemoteRetriever:
+    """Client for a running `retriever.py serve` daemon; same search API as Retriever."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+
+    def search(self, queries: List[str], k: int = 3, mode: str = None):
+        from langchain_core.documents import Document
+
+        if not queries:
+            return []
+        req = urllib.request.Request(
+            f"{self.url}/search",
+            data=json.dumps({"queries": list(queries), "k": k, "mode": mode}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req) as resp:
+            payload = json.loads(resp.read())
+        if "error" in payload:
+            raise RuntimeError(f"RAG server error: {payload['error']}")
+        return [
+            [(Document(page_content=h["page_content"], metadata=h["metadata"]), h["score"]) for h in row]
+            for row in payload["results"]
+        ]
+
+    def similarity_search(self, query: str, k: int = 4):
+        return [doc for doc, _ in self.search([query], k)[0]]
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(db_path: str = VECTOR_DB_PATH):
+    """
+    Process-wide retriever for db_path. If RAG_SERVER_URL is set, searches go
+    to that daemon instead of loading the model in this process.
+    """
+    url = os.getenv("RAG_SERVER_URL")
+    key = url or os.path.abspath(db_path)
+    with _retrievers_lock:
+        if key not in _retrievers:
+            _retrievers[key] = RemoteRetriever(url) if url else Retriever(db_path)
+        return _retrievers[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident RAG retriever")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve", help="Keep the index loaded and serve searches over HTTP")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_serve.add_argument("--db", default=VECTOR_DB_PATH)
+    p_query = sub.add_parser("query", help="One-off search")
+    p_query.add_argument("queries", nargs="+")
+    p_query.add_argument("-k", type=int, default=3)
+    p_query.add_argument("--mode", choices=["hybrid", "vector", "bm25"], default=None)
+    p_query.add_argument("--db", default=VECTOR_DB_PATH)
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        Retriever(args.db).serve(args.host, args.port)
+    else:
+        for q, hits in zip(args.queries, get_retriever(args.db).search(args.queries, args.k, args.mode)):
+            print(f"\nQuery: {q}")
+            for doc, score in hits:
+                print(f"  [{score:.3f}] {doc.metadata.get('cell_type')}: {doc.page_content[:120]!r}")
+        sys.exit(0)
@@ -0,0 +1,99 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+
+from pipeline import PIPELINE_WORKERS, Pipeline, assignment_stages, solution_stages
+
+
+def load_manifest(path):
+    """
+    Jobs from a CSV (header: job,pdf,notebook) or JSON (list of objects with
+    the same keys) manifest. job is optional and defaults to the notebook
+    name; relative paths are resolved against the manifest's directory.
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    base = os.path.dirname(os.path.abspath(path))
+    jobs, seen = [], set()
+    for i, row in enumerate(rows, start=1):
+        pdf, notebook = (row.get("pdf") or "").strip(), (row.get("notebook") or "").strip()
+        if not pdf or not notebook:
+            raise ValueError(f"{path}: entry {i} needs both 'pdf' and 'notebook'")
+        job = (row.get("job") or "").strip() or os.path.splitext(os.path.basename(notebook))[0]
+        job = re.sub(r"[^A-Za-z0-9_.-]+", "_", job)
+        if job in seen:
+            raise ValueError(f"{path}: duplicate job name {job!r}; give each entry a unique 'job'")
+        seen.add(job)
+        jobs.append({"job": job,
+                     "pdf": os.path.join(base, pdf),
+                     "notebook": os.path.join(base, notebook)})
+    return jobs
+
+
+def pdf_digest(pdf_path):
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_batch_pipeline(jobs, out_dir, compile_pdf=False):
+    """
+    One Pipeline for the whole manifest. Each distinct assignment PDF gets
+    one set of assignment stages under <out_dir>/assignments/<id>/, shared by
+    every job that uses it; each job gets its own notebook, index and
+    solution stages under <out_dir>/jobs/<job>/. Returns (pipeline, targets).
+    """
+    stages, targets, assignments = [], [], {}
+    for job in jobs:
+        # Assignments are identified by content, so copies of one PDF are processed once
+        digest = pdf_digest(job["pdf"])
+        if digest not in assignments:
+            aid = f"{os.path.splitext(os.path.basename(job['pdf']))[0]}-{digest[:8]}"
+            work_dir = os.path.join(out_dir, "assignments", aid)
+            os.makedirs(work_dir, exist_ok=True)
+            stages += assignment_stages(job["pdf"], work_dir, tag=f"@{aid}")
+            assignments[digest] = f"questions@{aid}"
+        job_dir = os.path.join(out_dir, "jobs", job["job"])
+        os.makedirs(job_dir, exist_ok=True)
+        tag = f"@{job['job']}"
+        stages += solution_stages(assignments[digest], job["notebook"], job_dir, tag=tag)
+        targets.append(f"{'compile' if compile_pdf else 'generate'}{tag}")
+
+    print(f"{len(jobs)} job(s) over {len(assignments)} distinct assignment PDF(s).")
+    return Pipeline(stages, state_dir=os.path.join(out_dir, ".pipeline")), targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the genai_qa pipeline for every (assignment PDF, notebook) pair in a manifest.")
+    parser.add_argument("manifest", help="CSV (job,pdf,notebook) or JSON manifest")
+    parser.add_argument("--out", default="batch_output", help="output root (default: batch_output)")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="stages run concurrently across all jobs")
+    parser.add_argument("--compile", action="store_true", help="also compile each solution.tex to PDF")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STAGE",
+                        help="re-run these stages (e.g. generate@alice) even if up to date; 'all' for every stage")
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    pipeline, targets = build_batch_pipeline(jobs, os.path.abspath(args.out), compile_pdf=args.compile)
+    report = pipeline.run(targets, force=args.force, workers=args.workers, keep_going=True)
+
+    failed = [t for t in targets if report[t][0] in ("failed", "blocked")]
+    print(f"\n{len(targets) - len(failed)}/{len(targets)} job(s) completed.")
+    if failed:
+        print("Failed: " + ", ".join(t.split("@", 1)[1] for t in failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
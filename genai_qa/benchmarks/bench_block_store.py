@@ -0,0 +1,76 @@
+"""
+Benchmark: write/load time and size of the linked-blocks intermediate as
+pickle, CSV and Parquet (block_store), including the column-projected read
+extractQuestionFromCsv does (latex_content + question_start_type only).
+
+The bundled qwen_debug_full_outputs.pkl is repeated to --rows blocks so the
+numbers reflect a large batch rather than one 15-block assignment; ids are
+renumbered and text/bbox values copied per row so pickle cannot share them.
+
+Run from genai_qa/:
+    python benchmarks/bench_block_store.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+import block_store
+from extractQuestionFromCsv import QUESTION_COLUMNS
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=os.path.join(BASE_DIR, "qwen_debug_full_outputs.pkl"))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs per measurement")
+    args = parser.parse_args()
+
+    seed = pd.read_pickle(args.source)
+    df = pd.concat([seed] * -(-args.rows // len(seed)), ignore_index=True).iloc[:args.rows].copy()
+    df["id"] = range(len(df))
+    for col in ("text", "latex_content"):
+        df[col] = df[col] + " #" + df["id"].astype(str)
+    df["bbox"] = [list(b) for b in df["bbox"]]
+    print(f"{len(df)} blocks, columns: {', '.join(df.columns)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "blocks")
+        pkl, csv, parquet = f"{base}.pkl", f"{base}.csv", f"{base}.parquet"
+        writes = {
+            "pickle": timed(lambda: df.to_pickle(pkl), args.repeat),
+            "csv": timed(lambda: df.to_csv(csv, index=False), args.repeat),
+            "parquet": timed(lambda: block_store.save_blocks(df, base, csv=False), args.repeat),
+        }
+        rows = [
+            ("pickle", "all", pkl, lambda: pd.read_pickle(pkl)),
+            ("csv", "all", csv, lambda: pd.read_csv(csv)),
+            ("csv", "projected", csv, lambda: pd.read_csv(csv, usecols=QUESTION_COLUMNS)),
+            ("parquet", "all", parquet, lambda: block_store.load_blocks(parquet)),
+            ("parquet", "projected", parquet, lambda: block_store.load_blocks(parquet, columns=QUESTION_COLUMNS)),
+        ]
+
+        header = f"{'format':<8} {'columns':<10} {'size MB':>8} {'write ms':>9} {'load ms':>9}"
+        print("\n" + header)
+        print("-" * len(header))
+        for fmt, columns, path, load in rows:
+            print(f"{fmt:<8} {columns:<10} {os.path.getsize(path) / 1e6:>8.2f} "
+                  f"{writes[fmt] * 1000:>9.1f} {timed(load, args.repeat) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
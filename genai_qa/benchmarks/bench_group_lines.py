@@ -0,0 +1,131 @@
+"""
+Benchmark: row-by-row group_lines (the original implementation) vs the
+vectorized pdf_layout.group_lines, on a synthetic span table.
+
+Run from genai_qa/:
+    python benchmarks/bench_group_lines.py --pages 500 --pdf input_pdf/DIP_3.pdf Gen_AI.pdf
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_layout import group_lines
+
+
+def group_lines_rowwise(df, y_gap=5):
+    """The original iterrows implementation from preclassification.py, unmodified."""
+    lines=[]
+    for page, grp in df.groupby("page"):
+        grp=grp.sort_values("y0")
+        if grp.empty: continue
+        buf=[grp.iloc[0]]
+        for _,r in list(grp.iterrows())[1:]:
+            if r.y0 - buf[-1].y1 < y_gap:
+                buf.append(r)
+            else:
+                if buf: lines.append(buf); buf=[r]
+        if buf: lines.append(buf)
+    out=[]
+    for ln in lines:
+        if not ln: continue
+        x0=min(l.x0 for l in ln); y0=min(l.y0 for l in ln)
+        x1=max(l.x1 for l in ln); y1=max(l.y1 for l in ln)
+        out.append({
+            "page":ln[0].page,
+            "bbox":[x0,y0,x1,y1],
+            "text":" ".join(l.text for l in ln),
+            "size":np.mean([l.size for l in ln]),
+            "bold":any(l.bold for l in ln)
+        })
+    return out
+
+
+def synthetic_spans(pages, lines_per_page=45, spans_per_line=6, seed=0):
+    """Dense, multi-column-ish pages: several spans per line, ragged line heights."""
+    rng = np.random.default_rng(seed)
+    n_lines = pages * lines_per_page
+    line_page = np.repeat(np.arange(1, pages + 1), lines_per_page)
+    line_height = rng.uniform(9.0, 14.0, n_lines)
+    line_gap = rng.choice([1.0, 2.0, 8.0, 20.0], n_lines, p=[0.5, 0.3, 0.15, 0.05])
+    offsets = np.cumsum((line_height + line_gap).reshape(pages, lines_per_page), axis=1) - (line_height + line_gap).reshape(pages, lines_per_page)
+    line_y0 = 50.0 + offsets.ravel()
+
+    n = n_lines * spans_per_line
+    page = np.repeat(line_page, spans_per_line)
+    jitter = rng.uniform(-0.5, 0.5, n)
+    y0 = np.repeat(line_y0, spans_per_line) + jitter
+    y1 = y0 + np.repeat(line_height, spans_per_line)
+    x0 = np.tile(np.arange(spans_per_line) * 80.0 + 40.0, n_lines) + rng.uniform(0, 5, n)
+    x1 = x0 + rng.uniform(20, 70, n)
+    size = np.repeat(rng.choice([10.0, 11.0, 12.0, 14.4], n_lines), spans_per_line)
+    bold = rng.random(n) < 0.1
+    text = [f"w{i}" for i in range(n)]
+
+    # Shuffle within the table to mimic arbitrary extraction order
+    perm = rng.permutation(n)
+    return pd.DataFrame({
+        "page": page[perm], "text": np.array(text, dtype=object)[perm],
+        "x0": x0[perm], "y0": y0[perm], "x1": x1[perm], "y1": y1[perm],
+        "font": "Synthetic", "size": size[perm], "bold": bold[perm],
+    })
+
+
+def line_diffs(a, b):
+    """Number of lines whose field differs, per field; {} when a and b are identical."""
+    if len(a) != len(b):
+        return {"line count": abs(len(a) - len(b))}
+    diffs = {}
+    for la, lb in zip(a, b):
+        for field, same in (("page", la["page"] == lb["page"]),
+                            ("text", la["text"] == lb["text"]),
+                            ("bold", bool(la["bold"]) == bool(lb["bold"])),
+                            ("bbox", np.allclose(la["bbox"], lb["bbox"])),
+                            ("size", np.isclose(la["size"], lb["size"]))):
+            if not same:
+                diffs[field] = diffs.get(field, 0) + 1
+    return diffs
+
+
+def compare(label, fast, slow):
+    diffs = line_diffs(fast, slow)
+    print(f"{label}: identical : {not diffs}" + (f"  (lines differing: {diffs})" if diffs else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="group_lines benchmark")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--skip-rowwise", action="store_true", help="Only time the vectorized version")
+    parser.add_argument("--pdf", nargs="*", default=[], help="also compare both versions on these PDFs' spans")
+    args = parser.parse_args()
+
+    if args.pdf:
+        from preclassification import load_spans
+
+        for pdf in args.pdf:
+            spans = load_spans(pdf)
+            compare(os.path.basename(pdf), group_lines(spans), group_lines_rowwise(spans))
+
+    df = synthetic_spans(args.pages)
+    print(f"{len(df)} spans over {args.pages} pages")
+
+    start = time.perf_counter()
+    fast = group_lines(df)
+    t_fast = time.perf_counter() - start
+    print(f"vectorized : {t_fast:8.3f} s  ({len(fast)} lines)")
+
+    if not args.skip_rowwise:
+        start = time.perf_counter()
+        slow = group_lines_rowwise(df)
+        t_slow = time.perf_counter() - start
+        print(f"row-wise   : {t_slow:8.3f} s  ({len(slow)} lines)")
+        print(f"speedup    : {t_slow / t_fast:8.1f}x")
+        compare("synthetic", fast, slow)
+
+
+if __name__ == "__main__":
+    main()
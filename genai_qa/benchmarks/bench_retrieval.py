@@ -0,0 +1,116 @@
+"""
+Benchmark: retrieval quality and latency of the RAG retriever over the
+bundled assignment, comparing whole-cell vs chunked documents and vector,
+BM25 and hybrid (RRF) ranking.
+
+Queries are the answerable leaves of yaml_parsed_questions/parsed_question_N.yaml.
+Ground truth is heuristic: the notebook is organised under "# QN" /
+"### Part x" headings, so a leaf under the j-th subproblem of question N is
+answered by documents whose section is "QN / Part <j-th letter>" (leaves
+without a subproblem accept anything under "QN"). A query counts as a hit
+at k if any of its top-k documents is relevant.
+
+Run from genai_qa/ (needs the MiniLM model):
+    python benchmarks/bench_retrieval.py --k 1 3 5
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BASE_DIR, "RAG"))
+from rag_implementation import build_rag_database
+from retriever import Retriever
+
+
+def load_queries(questions_dir):
+    """(query text, target section) for every answerable leaf."""
+    queries = []
+    for name in sorted(os.listdir(questions_dir)):
+        m = re.search(r"_(\d+)\.ya?ml$", name)
+        if not m:
+            continue
+        question = f"Q{m.group(1)}"
+        with open(os.path.join(questions_dir, name), "r", encoding="utf-8") as f:
+            tree = yaml.safe_load(f) or {}
+
+        def walk(node, target):
+            if not node.get("answerable", True):
+                return
+            children = [(key, node[key]) for key in ("problems", "subproblems", "sub_subproblems")
+                        if isinstance(node.get(key), dict) and node[key]]
+            if node.get("content") and not children:
+                queries.append((node["content"], target))
+            for key, group in children:
+                for j, child in enumerate(group.values()):
+                    walk(child, f"{question} / Part {chr(ord('a') + j)}" if key == "subproblems" else target)
+
+        walk(tree, question)
+    return queries
+
+
+def is_relevant(doc, target):
+    section = doc.metadata.get("section", "")
+    return section == target or section.startswith(target + " / ")
+
+
+def evaluate(retriever, queries, ks, mode):
+    texts = [q for q, _ in queries]
+    retriever.search(texts[:1], max(ks), mode)  # warm-up: model, index, BM25
+
+    start = time.perf_counter()
+    results = retriever.search(texts, max(ks), mode)
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts:
+        retriever.search([text], max(ks), mode)
+    single = (time.perf_counter() - start) / len(texts)
+
+    recall = {k: sum(any(is_relevant(doc, target) for doc, _ in hits[:k])
+                     for hits, (_, target) in zip(results, queries)) / len(queries) for k in ks}
+    return recall, batched, single
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json", default=os.path.join(BASE_DIR, "Jupyter file", "ans_parsed.json"))
+    parser.add_argument("--questions", default=os.path.join(BASE_DIR, "yaml_parsed_questions"))
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--modes", nargs="+", default=["vector", "bm25", "hybrid"])
+    args = parser.parse_args()
+
+    queries = load_queries(args.questions)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, chunk_chars in (("whole cells", None), ("chunked", 1200)):
+            db_path = os.path.join(tmp, label.replace(" ", "_"))
+            build_rag_database(args.json, db_path, incremental=False, chunk_chars=chunk_chars)
+            retriever = Retriever(db_path)
+            if chunk_chars is None:
+                # Only score queries whose target section exists in the notebook
+                store = retriever.load()
+                docs = [store.document(i) for i in range(len(store))]
+                total = len(queries)
+                queries = [(q, t) for q, t in queries if any(is_relevant(d, t) for d in docs)]
+                print(f"{len(queries)}/{total} queries from {args.questions} have a matching notebook section")
+            for mode in args.modes:
+                recall, batched, single = evaluate(retriever, queries, args.k, mode)
+                rows.append((f"{label} / {mode}", len(retriever.store), recall, batched, single))
+
+    header = f"{'configuration':<24} {'docs':>5} " + " ".join(f"{'R@' + str(k):>6}" for k in args.k) + f" {'batch ms':>9} {'ms/query':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for name, n_docs, recall, batched, single in rows:
+        print(f"{name:<24} {n_docs:>5} " + " ".join(f"{recall[k]:>6.2f}" for k in args.k)
+              + f" {batched * 1000:>9.1f} {single * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import re
+
+import numpy as np
+
+# Section cues, shared with preclassification.detect_sections
+SECTION_START_RE = re.compile(r"^\d+\.|^[A-Z].*?:")
+NUMBERED_RE = re.compile(r"^\d+\.\s*\S")
+MARKS_RE = re.compile(r"\bMarks?\b", re.I)
+
+# (label, confidence, pattern over the block's leading text); first match wins
+KEYWORD_RULES = [
+    ("metadata", 0.95, re.compile(r"^(due date|deadline|submission deadline|total marks|max(imum)? marks|course( code)?|instructor)\s*:", re.I)),
+    ("instruction", 0.95, re.compile(r"^(general )?instructions?\s*:", re.I)),
+    ("instruction", 0.9, re.compile(r"^submission( guidelines| instructions)?\s*:", re.I)),
+    ("note", 0.95, re.compile(r"^(notes?|hints?)\s*:", re.I)),
+    ("question", 0.9, re.compile(r"^(question|problem|q)\s*\d+\b", re.I)),
+    ("other", 0.95, re.compile(r"^(page\s*)?\d{1,3}(\s*(/|of)\s*\d{1,3})?$", re.I)),
+    ("other", 0.9, re.compile(r"^(references|bibliography)\b", re.I)),
+]
+# Longest block still treated as a title ("1. Directional Filtering:")
+TITLE_MAX_CHARS = 80
+# Average font size this much above the document median counts as emphasis
+SIZE_JUMP = 1.15
+
+
+def _lead(text):
+    """Block text without surrounding Markdown emphasis/heading markers."""
+    return re.sub(r"^[#*>\s]+", "", str(text)).strip().rstrip("*").strip()
+
+
+def classify_block(text, latex="", bold=False, size=0.0, page_start=0, first_on_page=False, median_size=0.0):
+    """
+    (label, confidence) for one block from its text and layout features.
+    Confidence reflects how reliably the cue alone decides the label:
+    explicit keywords ("Due Date:", "Note:", "Instructions:", page numbers)
+    are near-certain, numbered or emphasised titles ending in ':' are
+    questions, weaker cues (a "Marks" mention, a first-page title line)
+    score below the usual threshold so the LLM still decides.
+    """
+    lead = _lead(text) or _lead(latex)
+    if not lead:
+        return "other", 0.0
+    for label, confidence, pattern in KEYWORD_RULES:
+        if pattern.match(lead):
+            return label, confidence
+
+    emphasised = bool(bold) or str(latex).lstrip().startswith(("**", "#")) or \
+        (median_size > 0 and size >= SIZE_JUMP * median_size)
+    title = len(lead) <= TITLE_MAX_CHARS and lead.endswith(":")
+    if NUMBERED_RE.match(lead):
+        return "question", 0.9 if title else 0.6
+    if title:
+        return "question", 0.9 if emphasised else 0.6
+    if MARKS_RE.search(lead):
+        return "question", 0.7
+    if page_start == 1 and first_on_page and len(lead) <= TITLE_MAX_CHARS:
+        return "other", 0.7
+    return "technical", 0.3
+
+
+def rule_classify(df):
+    """
+    classify_block over every row of a blocks DataFrame; columns other than
+    latex_content are optional. Returns a list of (label, confidence).
+    """
+    n = len(df)
+    texts = df["text"].fillna("").tolist() if "text" in df else [""] * n
+    latex = df["latex_content"].fillna("").tolist() if "latex_content" in df else [""] * n
+    bold = df["bold"].tolist() if "bold" in df else [False] * n
+    sizes = df["size"].fillna(0.0).tolist() if "size" in df else [0.0] * n
+    pages = df["page_start"].tolist() if "page_start" in df else [0] * n
+
+    positive = [s for s in sizes if s > 0]
+    median_size = float(np.median(positive)) if positive else 0.0
+    results, seen_pages = [], set()
+    for i in range(n):
+        first_on_page = pages[i] not in seen_pages
+        seen_pages.add(pages[i])
+        results.append(classify_block(texts[i], latex[i], bold[i], sizes[i], pages[i],
+                                      first_on_page, median_size))
+    return results
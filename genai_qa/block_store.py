@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Low-cardinality label columns, stored dictionary-encoded and loaded as pandas categoricals
+CATEGORY_COLUMNS = ("block_type", "classified_by", "question_start_type", "bedrock_classification")
+BOOL_COLUMNS = ("bold",)
+BBOX_TYPE = pa.list_(pa.float64(), 4)
+
+# Set to 1 to write a <name>.csv copy next to every Parquet file for inspection
+CSV_EXPORT = os.getenv("BLOCKS_CSV_EXPORT", "0") == "1"
+
+
+def to_table(df):
+    """
+    Arrow table with typed block columns: bbox as a fixed-size list of four
+    float64s, bool flags, and the label columns dictionary-encoded. Other
+    columns keep the type pyarrow infers.
+    """
+    df = df.copy(deep=False)
+    for col in BOOL_COLUMNS:
+        if col in df:
+            df[col] = df[col].fillna(False).astype(bool)
+    for col in CATEGORY_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    if "bbox" not in df:
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    position = df.columns.get_loc("bbox")
+    boxes = df.pop("bbox")
+    if boxes.map(lambda b: b is None or isinstance(b, float)).any():
+        bbox = pa.array([None if b is None or isinstance(b, float) else [float(v) for v in b]
+                         for b in boxes], type=BBOX_TYPE)
+    else:
+        flat = np.asarray(boxes.tolist(), dtype=np.float64).reshape(-1)
+        bbox = pa.FixedSizeListArray.from_arrays(pa.array(flat), 4)
+    return pa.Table.from_pandas(df, preserve_index=False).add_column(position, "bbox", bbox)
+
+
+def save_blocks(df, base_path, csv=None):
+    """
+    Writes df to <base_path>.parquet (atomically, so a reader never sees a
+    partial file) and, when csv is True or BLOCKS_CSV_EXPORT=1, a debug copy
+    to <base_path>.csv. Returns the Parquet path.
+    """
+    directory = os.path.dirname(base_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    path = f"{base_path}.parquet"
+    tmp = f"{path}.tmp"
+    pq.write_table(to_table(df), tmp)
+    os.replace(tmp, path)
+    if CSV_EXPORT if csv is None else csv:
+        df.to_csv(f"{base_path}.csv", index=False)
+    return path
+
+
+def resolve(path):
+    """
+    path as given if it exists, else the first of <path>.parquet, .pkl, .csv
+    that does, so checkouts that still hold pickle/CSV intermediates load.
+    """
+    if os.path.exists(path):
+        return path
+    for ext in (".parquet", ".pkl", ".csv"):
+        if os.path.exists(path + ext):
+            return path + ext
+    raise FileNotFoundError(f"No block file at {path}(.parquet|.pkl|.csv)")
+
+
+def load_blocks(path, columns=None):
+    """
+    Blocks from a Parquet file (or a legacy .pkl/.csv; see resolve). columns
+    restricts the read to those columns, which for Parquet skips the others
+    on disk. bbox comes back as one float64 array per row.
+    """
+    path = resolve(path)
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns).to_pandas()
+    if path.endswith(".pkl"):
+        df = pd.read_pickle(path)
+        return df[columns] if columns is not None else df
+    return pd.read_csv(path, usecols=columns)
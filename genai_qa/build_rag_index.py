@@ -1,10 +1,10 @@
 import sys
 import os
 
-# Add the current directory to sys.path to allow imports from subdirectories
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# RAG modules import each other by top-level name
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "RAG"))
 
-from RAG.rag_implementation import build_rag_database
+from rag_implementation import build_rag_database
 
 if __name__ == "__main__":
     print("========================================")
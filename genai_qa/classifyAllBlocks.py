@@ -8,52 +8,62 @@
 # ================================================================
 
 import pandas as pd
-import pickle
-import time
-import random
+import io
 import re
 import json
 import warnings
 import os
-import boto3
+import threading
 from tqdm import tqdm
-from botocore.exceptions import ClientError
-env_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Notebook Processing", ".env")
-if os.path.exists(env_file_path):
-    with open(env_file_path, "r", encoding="utf-8") as _f:
-        for _line in _f:
-            _line = _line.strip()
-            if not _line or _line.startswith("#"):
-                continue
-            if "=" in _line:
-                _k, _v = _line.split("=", 1)
-                _v = _v.strip().strip('"').strip("'")
-                os.environ.setdefault(_k.strip(), _v)
-    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
-
-# Suppress warnings
-warnings.filterwarnings("ignore", category=UserWarning)
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import bedrock_limiter
+from llm_cache import llm_cache
+from env_file import load_env_file
+import block_store
+from block_rules import rule_classify
 
 # ================================================================
 # PART 1: SETUP AWS BEDROCK CLIENT (Done once)
 # ================================================================
-print("Setting up AWS Bedrock Client...")
 
 # --- Configuration ---
 BEDROCK_REGION = "us-east-1"
 BEDROCK_MODEL_ID = "meta.llama3-70b-instruct-v1:0"
+# Parallel Bedrock requests during question linking
+LINK_WORKERS = int(os.getenv("LINK_WORKERS", "4"))
+# 1 = one structured reason+decision call per block instead of reason -> summarize
+LINK_SINGLE_CALL = os.getenv("LINK_SINGLE_CALL", "0") == "1"
+# Blocks packed into one classification prompt (1 = one request per block)
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "10"))
+# Blocks the rule-based fast path labels with at least this confidence skip Bedrock (RULE_CLASSIFIER=0 disables it)
+RULE_CLASSIFIER = os.getenv("RULE_CLASSIFIER", "1") == "1"
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.9"))
+
+# Input of Task 1 and outputs of both tasks
+INPUT_BLOCKS_PATH = "export_for_kaggle/all_blocks_for_classification"
+CLASSIFIED_PATH = "all_blocks_classified"
+LINKED_PATH = "qwen_debug_full_outputs"
 
 # --- Client Initialization ---
-try:
-    bedrock_client = boto3.client(
-        service_name="bedrock-runtime",
-        region_name=BEDROCK_REGION,
-        # Ensure AWS credentials are in environment variables or ~/.aws/credentials
-    )
-    print(f"✅ Bedrock client initialized for model: {BEDROCK_MODEL_ID}")
-except Exception as e:
-    print(f"❌ Failed to initialize Bedrock client: {e}")
-    exit(1)
+_bedrock_client = None
+_client_lock = threading.Lock()
+
+def get_bedrock_client():
+    """Bedrock runtime client, created on first use and shared afterwards."""
+    global _bedrock_client
+    with _client_lock:
+        if _bedrock_client is None:
+            import boto3
+
+            load_env_file()
+            print("Setting up AWS Bedrock Client...")
+            _bedrock_client = boto3.client(
+                service_name="bedrock-runtime",
+                region_name=BEDROCK_REGION,
+                # Ensure AWS credentials are in environment variables or ~/.aws/credentials
+            )
+            print(f"✅ Bedrock client initialized for model: {BEDROCK_MODEL_ID}")
+    return _bedrock_client
 
 # --- Helper: Llama 3 Prompt Formatter ---
 def format_llama3_prompt(user_message: str, system_message: str = "") -> str:
@@ -69,33 +79,43 @@ def format_llama3_prompt(user_message: str, system_message: str = "") -> str:
     )
     return formatted
 
-# --- Helper: Bedrock Call with Exponential Backoff ---
+# --- Helper: Bedrock Call with Adaptive Rate Limiting ---
 def invoke_bedrock_with_backoff(body, model_id, max_attempts=8):
     """
-    Invokes AWS Bedrock model with exponential backoff for throttling errors.
+    Invokes AWS Bedrock model through the shared AIMD rate limiter.
+    Throttling lowers the shared rate instead of sleeping a fixed, doubling delay.
+    Responses are served from / stored in the on-disk LLM cache.
     """
-    delay = 1.0
+    from botocore.exceptions import ClientError
+
+    key = llm_cache.make_key(model_id, body)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return {"body": io.BytesIO(cached.encode("utf-8"))}
+
     for attempt in range(max_attempts):
+        bedrock_limiter.acquire()
         try:
-            response = bedrock_client.invoke_model(
+            response = get_bedrock_client().invoke_model(
                 body=json.dumps(body),
                 modelId=model_id,
                 contentType="application/json",
                 accept="application/json"
             )
+            bedrock_limiter.on_success()
+            raw = response["body"].read()
+            llm_cache.put(key, raw.decode("utf-8"))
+            response["body"] = io.BytesIO(raw)
             return response
             
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code == 'ThrottlingException':
+                bedrock_limiter.on_throttle()
                 if attempt == max_attempts - 1:
                     print(f"❌ Max retries reached. Bedrock Throttled.")
                     raise
-                
-                sleep_time = delay + random.uniform(0, 0.5)
-                # print(f"⚠️ Throttled. Retrying in {sleep_time:.2f}s...")
-                time.sleep(sleep_time)
-                delay *= 2
+                # print(f"⚠️ Throttled. Rate lowered to {bedrock_limiter.rate:.2f} req/s")
             else:
                 # If it's not a throttling error, raise it immediately
                 print(f"❌ Bedrock ClientError: {e}")
@@ -107,15 +127,9 @@ def invoke_bedrock_with_backoff(body, model_id, max_attempts=8):
 # ================================================================
 # PART 2: TASK 1 - BLOCK CLASSIFICATION
 # ================================================================
-print("\n" + "="*60)
-print("STARTING TASK 1: BLOCK CLASSIFICATION")
-print("="*60)
 
 # --- 2.1: Define Classification Prompt ---
-system_prompt_classify = """
-You are an expert document classifier. Your task is to classify a block of text from an assignment PDF into ONE of the following six categories.
-Respond with ONLY a JSON object in the format {"category": "category_name"}, and nothing else. Do not explain your reasoning.
-
+category_definitions = """
 Here are the categories and their definitions:
 
 1.  **instruction**: This is for document-level instructions. (e.g., "Instructions: For all the questions, write your own functions...", "Submission guidelines...")
@@ -124,12 +138,24 @@ Here are the categories and their definitions:
 4.  **question**: This is the main text of a *new* question or a major sub-section. It describes the *problem* to be solved. (e.g., "1. Directional Filtering:", "Question 2: Image Restoration")
 5.  **technical**: This provides supporting details *for* an assignment question. This includes lists of parameters, equations, or descriptive text *after* a question title. (e.g., "Directional filtering is used to emphasize...", "Compute the 2D DFT...")
 6.  **other**: Any text that does not fit, such as a "References" section, page headers/footers, or junk text.
+"""
 
+system_prompt_classify = f"""
+You are an expert document classifier. Your task is to classify a block of text from an assignment PDF into ONE of the following six categories.
+Respond with ONLY a JSON object in the format {{"category": "category_name"}}, and nothing else. Do not explain your reasoning.
+{category_definitions}
 Your response must be *only* the JSON object.
 """
+
+system_prompt_classify_batch = f"""
+You are an expert document classifier. Your task is to classify EACH numbered block of text from an assignment PDF into ONE of the following six categories.
+Respond with ONLY a JSON array in the format [{{"id": 0, "category": "category_name"}}, ...] containing exactly one object per block, using the block numbers given. Do not explain your reasoning.
+{category_definitions}
+Your response must be *only* the JSON array.
+"""
 labels_for_classifier = ["instruction", "metadata", "note", "question", "technical", "other"]
 
-# --- 2.2: Define Classification Function ---
+# --- 2.2: Define Classification Functions ---
 def bedrock_classify(block_text):
     """
     Runs the Llama 3 model on Bedrock to classify a single text block.
@@ -152,111 +178,187 @@ def bedrock_classify(block_text):
         # print(f"Error in classify call: {e}")
         return ""
 
-# --- 2.3: Run Classification Loop ---
-try:
-    input_pkl_path = "export_for_kaggle/all_blocks_for_classification.pkl"
-    df_all_blocks = pickle.load(open(input_pkl_path, "rb"))
-    print(f"Loaded {len(df_all_blocks)} blocks from {input_pkl_path}")
-except FileNotFoundError:
-    print(f"ERROR: Could not find {input_pkl_path}")
-    print("Please upload 'all_blocks_for_classification.pkl' and update the path.")
-    # Create dummy data
-    df_all_blocks = pd.DataFrame({
-        "id": [0, 1, 2, 3],
-        "latex_content": [
-            "**Instructions:** ...",
-            "**Note:** ...",
-            "1. What is 2+2?",
-            "Explain your answer."
-        ]
-    })
-
-classification_results = []
-
-# Using tqdm for progress tracking
-for i, row in tqdm(df_all_blocks.iterrows(), total=len(df_all_blocks), desc="Task 1: Classifying blocks"):
-    text = row["latex_content"]
-
-    if not text.strip():
-        classification_results.append("other")
-        continue
+def parse_single_label(raw_output):
+    """
+    Extracts the category from a single-block response; defaults to 'other'.
+    """
+    found_label = "other" # Default
+    json_match = re.search(r'\{.*\}', raw_output)
+    
+    if json_match:
+        try:
+            json_string = json_match.group(0).replace("'", "\"")
+            data = json.loads(json_string)
+            if "category" in data and data["category"] in labels_for_classifier:
+                found_label = data["category"]
+        except json.JSONDecodeError:
+            pass # Fallback
+    
+    if found_label == "other": # Fallback to string matching
+        for label in labels_for_classifier:
+            if label in raw_output.lower():
+                found_label = label
+                break
+    return found_label
+
+def bedrock_classify_batch(block_texts):
+    """
+    Classifies several blocks with one Bedrock request.
+    Returns a list aligned with block_texts; entries are a valid label or None
+    when the model's answer for that block was missing or not a known label.
+    """
+    user_content = "Here are the text blocks to classify:\n\n"
+    for j, text in enumerate(block_texts):
+        user_content += f"### Block {j}\n{text}\n\n"
+    final_prompt = format_llama3_prompt(user_content, system_prompt_classify_batch)
 
-    try:
-        raw_output = bedrock_classify(text)
-        
-        # --- JSON PARSING LOGIC ---
-        found_label = "other" # Default
-        json_match = re.search(r'\{.*\}', raw_output)
-        
-        if json_match:
-            try:
-                json_string = json_match.group(0).replace("'", "\"")
-                data = json.loads(json_string)
-                if "category" in data and data["category"] in labels_for_classifier:
-                    found_label = data["category"]
-            except json.JSONDecodeError:
-                pass # Fallback
-        
-        if found_label == "other": # Fallback to string matching
-            for label in labels_for_classifier:
-                if label in raw_output.lower():
-                    found_label = label
-                    break
-        
-        classification_results.append(found_label)
+    body = {
+        "prompt": final_prompt,
+        "max_gen_len": 20 * len(block_texts) + 20,
+        "temperature": 0.1,
+        "top_p": 0.9,
+    }
 
+    labels = [None] * len(block_texts)
+    try:
+        response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
+        response_body = json.loads(response.get("body").read())
+        raw_output = response_body.get("generation").strip()
     except Exception as e:
-        print(f"Error classifying block {row['id']}: {e}")
-        classification_results.append("other")
+        # print(f"Error in batch classify call: {e}")
+        return labels
 
-df_all_blocks["block_type"] = classification_results
+    array_match = re.search(r'\[.*\]', raw_output, re.DOTALL)
+    if not array_match:
+        return labels
+    try:
+        items = json.loads(array_match.group(0).replace("'", "\""))
+    except json.JSONDecodeError:
+        return labels
 
-# --- 2.4: Save Classification Results ---
-df_all_blocks.to_csv("all_blocks_classified.csv", index=False)
-pickle.dump(df_all_blocks, open("all_blocks_classified.pkl", "wb"))
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("id", pos)
+        label = str(item.get("category", "")).strip().lower()
+        if isinstance(idx, int) and 0 <= idx < len(labels) and label in labels_for_classifier:
+            labels[idx] = label
+    return labels
+
+# --- 2.3: Run Classification Loop ---
+def load_blocks_for_classification(input_path=INPUT_BLOCKS_PATH):
+    try:
+        df_all_blocks = block_store.load_blocks(input_path)
+        print(f"Loaded {len(df_all_blocks)} blocks from {block_store.resolve(input_path)}")
+        return df_all_blocks
+    except FileNotFoundError:
+        print(f"ERROR: Could not find {input_path}.parquet")
+        print("Please upload 'all_blocks_for_classification.parquet' and update the path.")
+        # Create dummy data
+        return pd.DataFrame({
+            "id": [0, 1, 2, 3],
+            "latex_content": [
+                "**Instructions:** ...",
+                "**Note:** ...",
+                "1. What is 2+2?",
+                "Explain your answer."
+            ]
+        })
+
+def _classify_requests(n_blocks):
+    """Bedrock requests the first classification pass needs for n_blocks blocks."""
+    return -(-n_blocks // CLASSIFY_BATCH_SIZE) if CLASSIFY_BATCH_SIZE > 1 else n_blocks
+
+def classify_blocks(df_all_blocks):
+    """
+    Task 1: labels every block; returns a copy with block_type and
+    classified_by (empty / rules / llm) columns.
+    """
+    print("\n" + "="*60)
+    print("STARTING TASK 1: BLOCK CLASSIFICATION")
+    print("="*60)
+
+    df_all_blocks = df_all_blocks.copy()
+    # Empty blocks are 'other' without asking the model
+    texts = df_all_blocks["latex_content"].tolist()
+    classification_results = ["other"] * len(texts)
+    classified_by = ["empty"] * len(texts)
+    pending = [i for i, text in enumerate(texts) if text.strip()]
+
+    # Fast path: blocks whose layout/keyword cues are unambiguous never reach the LLM
+    non_empty = len(pending)
+    if RULE_CLASSIFIER:
+        rule_results = rule_classify(df_all_blocks)
+        llm_pending = []
+        for i in pending:
+            label, confidence = rule_results[i]
+            if confidence >= RULE_CONFIDENCE_THRESHOLD:
+                classification_results[i] = label
+                classified_by[i] = "rules"
+            else:
+                llm_pending.append(i)
+        pending = llm_pending
+    for i in pending:
+        classified_by[i] = "llm"
+
+    # Batched pass: N blocks per request, unparseable items are retried one by one
+    fallback = []
+    if CLASSIFY_BATCH_SIZE > 1:
+        batches = [pending[b:b + CLASSIFY_BATCH_SIZE] for b in range(0, len(pending), CLASSIFY_BATCH_SIZE)]
+        for batch in tqdm(batches, desc=f"Task 1: Classifying blocks (batches of {CLASSIFY_BATCH_SIZE})"):
+            labels = bedrock_classify_batch([texts[i] for i in batch])
+            for i, label in zip(batch, labels):
+                if label is None:
+                    fallback.append(i)
+                else:
+                    classification_results[i] = label
+        print(f"Batched classification: {len(pending) - len(fallback)}/{len(pending)} blocks labelled, "
+              f"{len(fallback)} falling back to single-block calls.")
+    else:
+        fallback = pending
+
+    # Using tqdm for progress tracking
+    for i in tqdm(fallback, desc="Task 1: Classifying blocks"):
+        try:
+            raw_output = bedrock_classify(texts[i])
+            classification_results[i] = parse_single_label(raw_output)
+        except Exception as e:
+            print(f"Error classifying block {df_all_blocks.iloc[i]['id']}: {e}")
+            classification_results[i] = "other"
+
+    df_all_blocks["block_type"] = classification_results
+    df_all_blocks["classified_by"] = classified_by
+
+    print("✅ Task 1: Classification complete.")
+    if RULE_CLASSIFIER:
+        avoided = _classify_requests(non_empty) - _classify_requests(len(pending))
+        print(f"Rule-based fast path: {non_empty - len(pending)}/{non_empty} blocks labelled without Bedrock "
+              f"(confidence >= {RULE_CONFIDENCE_THRESHOLD}), {avoided} classification request(s) avoided.")
+    print(llm_cache.report())
+    print("\nBlock type counts:")
+    print(df_all_blocks["block_type"].value_counts())
+    return df_all_blocks
 
-print("✅ Task 1: Classification complete.")
-print("Saved 'all_blocks_classified.csv' and 'all_blocks_classified.pkl'")
-print("\nBlock type counts:")
-print(df_all_blocks["block_type"].value_counts())
+# --- 2.4: Save Classification Results ---
+def save_blocks(df, base_path):
+    """Writes df to <base_path>.parquet (plus <base_path>.csv with BLOCKS_CSV_EXPORT=1)."""
+    path = block_store.save_blocks(df, base_path)
+    print(f"Saved '{path}'" + (f" and '{base_path}.csv'" if block_store.CSV_EXPORT else ""))
 
 
 # ================================================================
 # PART 3: TASK 2 - QUESTION LINKING
 # ================================================================
-print("\n" + "="*60)
-print("STARTING TASK 2: QUESTION LINKING")
-print("="*60)
-
-# --- 3.1: Load and Filter Data (from Task 1) ---
-try:
-    df_classified = pickle.load(open("all_blocks_classified.pkl", "rb"))
-    
-    # Filter for only relevant blocks
-    df_filtered = df_classified[
-        df_classified['block_type'].isin(['question', 'technical'])
-    ].copy()
-    
-    # Reset index
-    df = df_filtered.reset_index(drop=True)
-    
-    print(f"Loaded {len(df_classified)} classified blocks.")
-    print(f"Filtered down to {len(df)} 'question' and 'technical' blocks for linking.")
 
-except FileNotFoundError:
-    print("Error: 'all_blocks_classified.pkl' not found. Cannot proceed to Task 2.")
-    df = pd.DataFrame() 
+# --- 3.2: Define Linking Functions ---
 
-if not df.empty:
-    # --- 3.2: Define Linking Functions ---
+def build_link_prompt(history_blocks, candidate_block):
+    """Shared NEW/CONT analysis prompt; callers append the answer format."""
+    hist_text = ""
+    for i, b in enumerate(history_blocks):
+        hist_text += f"Block {i+1}:\n{b}\n\n"
 
-    # STEP 1 — RAW CLASSIFIER
-    def bedrock_raw_decision(history_blocks, candidate_block):
-        hist_text = ""
-        for i, b in enumerate(history_blocks):
-            hist_text += f"Block {i+1}:\n{b}\n\n"
-
-        prompt_text = f"""
+    return f"""
 You are analyzing a sequence of assignment PDF blocks.
 
 Below are up to the last 4 previous blocks:
@@ -279,29 +381,32 @@ One strong cue you can look for start of a new question is that its previous blo
 Does the FINAL BLOCK start a NEW QUESTION (NEW)
 or does it CONTINUE the same question (CONT)?
 
-Explain your reasoning. 
 """
-        final_prompt = format_llama3_prompt(prompt_text)
-        
-        body = {
-            "prompt": final_prompt,
-            "max_gen_len": 200,
-            "temperature": 0.1,
-            "top_p": 0.9,
-        }
-        
-        try:
-            response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
-            response_body = json.loads(response.get("body").read())
-            return response_body.get("generation").strip()
-        except Exception as e:
-            # print(f"Error in raw decision: {e}")
-            return ""
 
-    # STEP 2 — SUMMARIZER
-    def bedrock_summarize(explanation_only):
-        
-        prompt_text = f"""
+# STEP 1 — RAW CLASSIFIER
+def bedrock_raw_decision(history_blocks, candidate_block):
+    prompt_text = build_link_prompt(history_blocks, candidate_block) + "Explain your reasoning. \n"
+    final_prompt = format_llama3_prompt(prompt_text)
+
+    body = {
+        "prompt": final_prompt,
+        "max_gen_len": 200,
+        "temperature": 0.1,
+        "top_p": 0.9,
+    }
+
+    try:
+        response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
+        response_body = json.loads(response.get("body").read())
+        return response_body.get("generation").strip()
+    except Exception as e:
+        # print(f"Error in raw decision: {e}")
+        return ""
+
+# STEP 2 — SUMMARIZER
+def bedrock_summarize(explanation_only):
+
+    prompt_text = f"""
 The text below is an explanation written by another AI:
 
 EXPLANATION:
@@ -320,95 +425,185 @@ CONT    -> means block continues previous question
 
 Do NOT re-evaluate the PDF blocks. Only infer from explanation.
 """
-        final_prompt = format_llama3_prompt(prompt_text)
+    final_prompt = format_llama3_prompt(prompt_text)
 
-        body = {
-            "prompt": final_prompt,
-            "max_gen_len": 50,
-            "temperature": 0.1,
-            "top_p": 0.9,
-        }
+    body = {
+        "prompt": final_prompt,
+        "max_gen_len": 50,
+        "temperature": 0.1,
+        "top_p": 0.9,
+    }
 
-        try:
-            response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
-            response_body = json.loads(response.get("body").read())
-            
-            raw_summary = response_body.get("generation").strip()
-            ans = raw_summary.upper().strip()
-            
-            # Debug prints
-            print('#########################THIS IS THE RAW SUMMARY OF STEP 2', end= " ")
-            print("#########################", ans)
-            
-            if "NEW" in ans:
-                return "NEW", raw_summary
-            if "CONT" in ans:
-                return "CONT", raw_summary
-            return "CONT", raw_summary 
-            
-        except Exception as e:
-            # print(f"Error in summarize: {e}")
-            return "CONT", ""
+    try:
+        response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
+        response_body = json.loads(response.get("body").read())
 
-    # --- 3.3: Run Linking Pipeline ---
-    results = []
-    history = []
-    
-    for i in tqdm(range(len(df)), desc="Task 2: Linking questions"):
-        block = df.loc[i, "latex_content"]
+        raw_summary = response_body.get("generation").strip()
+        # raw_summary is shown in link_block's ordered per-block log
+        ans = raw_summary.upper().strip()
 
-        if i == 0:
-            results.append("start of a new question")
-            history.append(block)
-            continue
+        if "NEW" in ans:
+            return "NEW", raw_summary
+        if "CONT" in ans:
+            return "CONT", raw_summary
+        return "CONT", raw_summary 
 
-        window = history[-4:]
+    except Exception as e:
+        # print(f"Error in summarize: {e}")
+        return "CONT", ""
+
+# SINGLE CALL — REASON + DECISION IN ONE STRUCTURED RESPONSE
+def bedrock_link_decision(history_blocks, candidate_block):
+    prompt_text = build_link_prompt(history_blocks, candidate_block) + (
+        "Think about it briefly, then respond with ONLY a JSON object in the format "
+        '{"reason": "<one or two sentences>", "decision": "NEW" or "CONT"}.\n'
+    )
+    final_prompt = format_llama3_prompt(prompt_text)
 
-        print("\n\n==============================================================")
-        print(f"PROCESSING FILTERED BLOCK {i} (Original ID: {df.loc[i, 'id']})")
-        print("==============================================================")
+    body = {
+        "prompt": final_prompt,
+        "max_gen_len": 200,
+        "temperature": 0.1,
+        "top_p": 0.9,
+    }
 
+    try:
+        response = invoke_bedrock_with_backoff(body, BEDROCK_MODEL_ID)
+        response_body = json.loads(response.get("body").read())
+        raw = response_body.get("generation").strip()
+    except Exception as e:
+        # print(f"Error in link decision: {e}")
+        return "CONT", ""
+
+    json_match = re.search(r'\{.*\}', raw, re.DOTALL)
+    if json_match:
         try:
+            decision = str(json.loads(json_match.group(0)).get("decision", "")).upper()
+            if decision in ("NEW", "CONT"):
+                return decision, raw
+        except json.JSONDecodeError:
+            pass
+    # Same keyword fallback as the summarizer
+    ans = raw.upper()
+    if "NEW" in ans and "CONT" not in ans:
+        return "NEW", raw
+    return "CONT", raw
+
+def link_block(i, window, block, block_id):
+    """
+    Decides NEW/CONT for one block. The window holds raw text of the previous
+    blocks (not earlier decisions), so blocks are independent and can run in
+    parallel. Returns (label, debug_log) so output can be printed in order.
+    """
+    log = []
+    log.append("\n\n==============================================================")
+    log.append(f"PROCESSING FILTERED BLOCK {i} (Original ID: {block_id})")
+    log.append("==============================================================")
+
+    try:
+        if LINK_SINGLE_CALL:
+            final_label, raw = bedrock_link_decision(window, block)
+
+            log.append("\n-------------------- STRUCTURED OUTPUT --------------------")
+            log.append(raw)
+            log.append("-------------------- END STRUCTURED OUTPUT ----------------\n")
+        else:
             # ----------------- STEP 1: RAW CLASSIFIER --------------------------
             raw1 = bedrock_raw_decision(window, block)
 
-            print("\n-------------------- STEP 1 : FULL RAW OUTPUT --------------------")
-            print(raw1)
-            print("-------------------- END STEP 1 RAW -------------------------------\n")
+            log.append("\n-------------------- STEP 1 : FULL RAW OUTPUT --------------------")
+            log.append(raw1)
+            log.append("-------------------- END STEP 1 RAW -------------------------------\n")
 
             explanation = raw1.strip()
-            
-            print("\n-------------- EXPLANATION PASSED TO STEP 2 ----------------")
-            print(explanation)
-            print("-------------- END EXPLANATION -----------------------------\n")
+
+            log.append("\n-------------- EXPLANATION PASSED TO STEP 2 ----------------")
+            log.append(explanation)
+            log.append("-------------- END EXPLANATION -----------------------------\n")
 
             # ----------------- STEP 2: SUMMARIZER ------------------------------
             final_label, raw2 = bedrock_summarize(explanation)
-            
-            print("\n-------------------- STEP 2 : FULL SUMMARIZER OUTPUT --------------------")
-            print(raw2)
-            print("-------------------- END STEP 2 RAW -------------------------------\n")
-            
-            print("FINAL DECISION :", final_label)
 
-            if final_label == "NEW":
-                results.append("start of a new question")
-            else:
-                results.append("continuation of previous question")
-        
-        except Exception as e:
-            print(f"Error linking block {i} (Original ID: {df.loc[i, 'id']}): {e}")
-            results.append("continuation of previous question") # Default to CONT
+            log.append("\n-------------------- STEP 2 : FULL SUMMARIZER OUTPUT --------------------")
+            log.append(raw2)
+            log.append("-------------------- END STEP 2 RAW -------------------------------\n")
+
+        log.append(f"FINAL DECISION : {final_label}")
 
-        history.append(block)
+        if final_label == "NEW":
+            return "start of a new question", "\n".join(log)
+        return "continuation of previous question", "\n".join(log)
+
+    except Exception as e:
+        log.append(f"Error linking block {i} (Original ID: {block_id}): {e}")
+        return "continuation of previous question", "\n".join(log) # Default to CONT
+
+# --- 3.3: Run Linking Pipeline ---
+def link_questions(df_classified):
+    """
+    Task 2: keeps the 'question' and 'technical' blocks and labels each one as
+    the start of a new question or a continuation (question_start_type).
+    Returns the filtered, re-indexed DataFrame; empty if nothing qualifies.
+    """
+    print("\n" + "="*60)
+    print("STARTING TASK 2: QUESTION LINKING")
+    print("="*60)
+
+    # Filter for only relevant blocks
+    df_filtered = df_classified[
+        df_classified['block_type'].isin(['question', 'technical'])
+    ].copy()
+
+    # Reset index
+    df = df_filtered.reset_index(drop=True)
+
+    print(f"Loaded {len(df_classified)} classified blocks.")
+    print(f"Filtered down to {len(df)} 'question' and 'technical' blocks for linking.")
+    if df.empty:
+        print("Skipping Task 2 because no 'question' or 'technical' blocks were found.")
+        return df
+
+    blocks = df["latex_content"].tolist()
+    ids = df["id"].tolist()
+    results = ["start of a new question"]
+
+    mode = "single structured call" if LINK_SINGLE_CALL else "reason -> summarize"
+    print(f"Linking {len(blocks) - 1} blocks with {LINK_WORKERS} workers ({mode}).")
+
+    with ThreadPoolExecutor(max_workers=max(1, LINK_WORKERS)) as pool:
+        # pool.map yields in submission order, so logs and labels stay aligned with df
+        outcomes = pool.map(
+            lambda i: link_block(i, blocks[max(0, i - 4):i], blocks[i], ids[i]),
+            range(1, len(blocks))
+        )
+        for label, log in tqdm(outcomes, total=len(blocks) - 1, desc="Task 2: Linking questions"):
+            print(log)
+            results.append(label)
 
-    # --- 3.4: Save Final Linking Results ---
     df["question_start_type"] = results
-    
-    df.to_csv("qwen_debug_full_outputs.csv", index=False)
-    pickle.dump(df, open("qwen_debug_full_outputs.pkl", "wb"))
 
     print("\n✅ Task 2: Question linking complete.")
-    print("Saved 'qwen_debug_full_outputs.csv' and 'qwen_debug_full_outputs.pkl'")
-else:
-    print("Skipping Task 2 because no 'question' or 'technical' blocks were found.")
+    print(llm_cache.report())
+    return df
+
+
+def main():
+    # Suppress warnings
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    try:
+        get_bedrock_client()
+    except Exception as e:
+        print(f"❌ Failed to initialize Bedrock client: {e}")
+        exit(1)
+
+    df_classified = classify_blocks(load_blocks_for_classification())
+    save_blocks(df_classified, CLASSIFIED_PATH)
+
+    df = link_questions(df_classified)
+    if not df.empty:
+        save_blocks(df, LINKED_PATH)
+
+
+if __name__ == "__main__":
+    main()
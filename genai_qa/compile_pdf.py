@@ -7,20 +7,24 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEX_FILE = os.path.join(BASE_DIR, "solution.tex")
 PDF_FILE = os.path.join(BASE_DIR, "solution.pdf")
 
-def compile_tex_to_pdf():
+def compile_tex_to_pdf(tex_file=TEX_FILE):
     """
-    Compile solution.tex to PDF using pdflatex
+    Compile tex_file (default solution.tex) to a PDF next to it using pdflatex
     """
-    if not os.path.exists(TEX_FILE):
-        print(f"❌ Error: {TEX_FILE} not found!")
+    tex_file = os.path.abspath(tex_file)
+    out_dir = os.path.dirname(tex_file)
+    stem = os.path.splitext(os.path.basename(tex_file))[0]
+    pdf_file = os.path.join(out_dir, f"{stem}.pdf")
+    if not os.path.exists(tex_file):
+        print(f"❌ Error: {tex_file} not found!")
         print(f"Please run 'python generate_solution.py' first to generate the LaTeX file.")
         return False
     
     print(f"{'='*60}")
     print(f"📄 Compiling LaTeX to PDF")
     print(f"{'='*60}\n")
-    print(f"Input:  {TEX_FILE}")
-    print(f"Output: {PDF_FILE}\n")
+    print(f"Input:  {tex_file}")
+    print(f"Output: {pdf_file}\n")
     
     # Check if pdflatex is available
     try:
@@ -48,12 +52,12 @@ def compile_tex_to_pdf():
                 [
                     "pdflatex",
                     "-interaction=nonstopmode",  # Don't stop on errors
-                    "-output-directory=" + BASE_DIR,
-                    TEX_FILE
+                    "-output-directory=" + out_dir,
+                    tex_file
                 ],
                 capture_output=True,
                 text=True,
-                cwd=BASE_DIR,
+                cwd=out_dir,
                 timeout=60
             )
             
@@ -76,12 +80,12 @@ def compile_tex_to_pdf():
             return False
     
     # Check if PDF was created
-    if os.path.exists(PDF_FILE):
-        file_size = os.path.getsize(PDF_FILE) / 1024  # KB
+    if os.path.exists(pdf_file):
+        file_size = os.path.getsize(pdf_file) / 1024  # KB
         print(f"\n{'='*60}")
         print(f"✅ PDF successfully created!")
         print(f"{'='*60}")
-        print(f"📍 Location: {PDF_FILE}")
+        print(f"📍 Location: {pdf_file}")
         print(f"📊 Size: {file_size:.2f} KB")
         print(f"\nYou can now open the PDF file.")
         
@@ -89,18 +93,18 @@ def compile_tex_to_pdf():
         cleanup_extensions = ['.aux', '.log', '.out', '.toc']
         print(f"\n🧹 Cleaning up auxiliary files...")
         for ext in cleanup_extensions:
-            aux_file = os.path.join(BASE_DIR, f"solution{ext}")
+            aux_file = os.path.join(out_dir, f"{stem}{ext}")
             if os.path.exists(aux_file):
                 try:
                     os.remove(aux_file)
-                    print(f"  Removed: solution{ext}")
+                    print(f"  Removed: {stem}{ext}")
                 except:
                     pass
         
         return True
     else:
         print(f"\n❌ Error: PDF file was not created")
-        print(f"Check the LaTeX log file for details: solution.log")
+        print(f"Check the LaTeX log file for details: {stem}.log")
         return False
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import os
+import threading
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Notebook Processing", ".env")
+
+_loaded = set()
+_lock = threading.Lock()
+
+
+def load_env_file(path=ENV_FILE):
+    """
+    Copies KEY=VALUE lines of the .env file into os.environ without
+    overriding variables that are already set. Runs once per path and
+    process; callers invoke it right before creating an AWS client, so
+    importing a module never touches the environment.
+    """
+    with _lock:
+        if path in _loaded:
+            return
+        _loaded.add(path)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "=" in line:
+                    k, v = line.split("=", 1)
+                    v = v.strip().strip('"').strip("'")
+                    os.environ.setdefault(k.strip(), v)
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
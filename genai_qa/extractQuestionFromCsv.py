@@ -1,5 +1,5 @@
 # author : Adithya
-import pandas as pd
+import block_store
 from subpart_split import parse_problem_text
 import yaml
 import os
@@ -29,10 +29,19 @@ def save_problem_to_file(problem_obj, filename: str):
     print(f"✅ Saved: {filename}")
 
 
-def extract_questions_from_csv(file_path):
-    df = pd.read_csv(file_path)
+QUESTION_COLUMNS = ['latex_content', 'question_start_type']
+
+
+def extract_questions_from_file(file_path):
+    """extract_questions over a linked-blocks file, reading only the columns it needs."""
+    return extract_questions(block_store.load_blocks(file_path, columns=QUESTION_COLUMNS))
+
+
+def extract_questions(df):
+    """Groups linked blocks (latex_content, question_start_type) into question texts."""
+    df = df.copy()
     df['latex_content'] = df['latex_content'].fillna('')
-    df['question_start_type'] = df['question_start_type'].fillna('')
+    df['question_start_type'] = df['question_start_type'].astype(object).fillna('')
 
     def is_title_like(text: str) -> bool:
         t = text.strip()
@@ -80,12 +89,35 @@ def extract_questions_from_csv(file_path):
 
     return merge_short_titles(groups)
 
+def write_question_yamls(questions, output_dir='yaml_parsed_questions'):
+    """Parses every question into subparts and writes parsed_question_<n>.yaml."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Clean previous runs
+    for f in os.listdir(output_dir):
+        os.remove(os.path.join(output_dir, f))
+
+    # Process every question
+    for i, question in enumerate(questions):
+        print("="*40)
+        print(f"\nProcessing question {i+1}/{len(questions)}...")
+
+        if not question.strip():
+            print("Skipping empty text block.")
+            continue
+
+        parsed = parse_problem_text(question)
+        save_problem_to_file(parsed, f'{output_dir}/parsed_question_{i+1}.yaml')
+
 # -------------------------
 # RUNNING THE EXTRACTION
 # -------------------------
 
 if __name__ == "__main__":
     candidates = [
+        'qwen_debug_full_outputs.parquet',
+        os.path.join('classifiedBlocksOutput', 'classified_blocks.parquet'),
+        # Intermediates written before the switch to Parquet
         'qwen_debug_full_outputs.csv',
         os.path.join('classifiedBlocksOutput', 'qwen_debug_full_outputs.csv'),
     ]
@@ -95,29 +127,12 @@ if __name__ == "__main__":
             file_name = c
             break
     if not file_name:
-        print("❌ Error: qwen_debug_full_outputs.csv not found in project root or classifiedBlocksOutput/.")
+        print("❌ Error: qwen_debug_full_outputs.parquet not found in project root or classifiedBlocksOutput/.")
         exit()
 
-    questions = extract_questions_from_csv(file_name)
+    questions = extract_questions_from_file(file_name)
     print(f"Successfully extracted {len(questions)} questions from {file_name}.")
 
-    output_dir = 'yaml_parsed_questions'
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Clean previous runs
-    for f in os.listdir(output_dir):
-        os.remove(os.path.join(output_dir, f))
-
-    # Process every question
-    for i, question in enumerate(questions):
-        print("="*40)
-        print(f"\nProcessing question {i+1}/{len(questions)}...")
-        
-        if not question.strip():
-            print("Skipping empty text block.")
-            continue
-
-        parsed = parse_problem_text(question)
-        save_problem_to_file(parsed, f'{output_dir}/parsed_question_{i+1}.yaml')
+    write_question_yamls(questions)
 
     print("\nAll done.")
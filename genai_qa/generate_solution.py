@@ -1,7 +1,10 @@
 import os
+import sys
 import yaml
 import json
 import time
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
     import boto3
 except Exception:
@@ -11,18 +14,27 @@ try:
 except Exception:
     load_dotenv = None
 try:
-    from langchain_community.vectorstores import FAISS
+    import faiss
     from langchain_huggingface import HuggingFaceEmbeddings
 except Exception:
-    FAISS = None
+    faiss = None
     HuggingFaceEmbeddings = None
 from tqdm import tqdm
+from rate_limiter import bedrock_limiter
+from llm_cache import llm_cache
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Import RAG modules by their top-level names, as RAG/rag_implementation.py does,
+# so there is one retriever module (and retriever cache) per process
+sys.path.append(os.path.join(BASE_DIR, "RAG"))
+from retriever import get_retriever
+
 QUESTIONS_DIR = os.path.join(BASE_DIR, "yaml_parsed_questions")
 RAG_INDEX_PATH = os.path.join(BASE_DIR, "RAG", "faiss_index")
 OUTPUT_TEX_FILE = os.path.join(BASE_DIR, "solution.tex")
+# Concurrent solution requests; Bedrock throughput itself is capped by bedrock_limiter
+SOLUTION_WORKERS = int(os.getenv("SOLUTION_WORKERS", "4"))
 
 REGION_NAME = os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
 
@@ -76,15 +88,20 @@ def get_bedrock_client():
         return None
 
 def load_rag_index(path: str):
+    """
+    Returns the process-wide retriever for path (model and index stay loaded;
+    a RAG_SERVER_URL daemon is used instead when set).
+    """
+    if os.getenv("RAG_SERVER_URL"):
+        return get_retriever(path)
     if not os.path.exists(path):
-        raise FileNotFoundError(f"RAG index not found at {path}")
-    if HuggingFaceEmbeddings is None or FAISS is None:
+        raise FileNotFoundError(f"RAG index not found at {path}; build it with build_rag_index.py")
+    if HuggingFaceEmbeddings is None or faiss is None:
         print("RAG dependencies not available. Proceeding without context retrieval.")
         return None
-    print(f"Loading RAG index from {path}...")
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vector_db = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
-    return vector_db
+    retriever = get_retriever(path)
+    retriever.load()
+    return retriever
 
 def generate_latex_with_bedrock(client, question_text: str, context_code: str) -> str:
     """
@@ -124,12 +141,16 @@ def generate_latex_with_bedrock(client, question_text: str, context_code: str) -
 
     if client is None:
         return f"\\emph{{Solution generated offline.}}\\\n\\small{{{question_text}}}"
-    max_retries = 3
+    cache_key = llm_cache.make_key(MODEL_ID, body)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    max_retries = 5
     for attempt in range(max_retries):
+        # Shared adaptive rate limit for Bedrock (replaces the fixed 10s sleep)
+        bedrock_limiter.acquire()
         try:
-            # Rate limiting for Bedrock
-            time.sleep(10) 
-            
             response = client.invoke_model(
                 body=body,
                 modelId=MODEL_ID,
@@ -139,167 +160,206 @@ def generate_latex_with_bedrock(client, question_text: str, context_code: str) -
             
             response_body = json.loads(response.get('body').read())
             generation = response_body.get('generation')
+            bedrock_limiter.on_success()
+            llm_cache.put(cache_key, generation.strip())
             return generation.strip()
 
         except Exception as e:
             if "ThrottlingException" in str(e) and attempt < max_retries - 1:
-                print(f"  ⚠️ Throttled. Retrying in 20s... (Attempt {attempt+1}/{max_retries})")
-                time.sleep(20)
+                bedrock_limiter.on_throttle()
+                print(f"  ⚠️ Throttled. Rate lowered to {bedrock_limiter.rate:.2f} req/s (Attempt {attempt+1}/{max_retries})")
             else:
                 print(f"Bedrock API Error: {e}")
                 return f"% Error generating solution: {e}"
 
-def process_node(node, vector_db, bedrock_client, tex_file, labels=None, depth=0):
+def _leaf_output_format(node, content: str) -> str:
+    """Output format of an answerable leaf: YAML output_format/output_type, else inferred from the text."""
+    # Get output_format from YAML (preferred over output_type)
+    output_format = node.get("output_format", node.get("output_type", ""))
+
+    # Fallback: infer from content if not specified
+    if not output_format:
+        lc = content.lower()
+        if any(w in lc for w in ["image", "plot", "spectrum", "figure", "magnitude spectrum"]):
+            output_format = "image"
+        elif any(w in lc for w in ["explain", "comment", "report", "compute", "text"]):
+            output_format = "text"
+        else:
+            output_format = "text"
+
+    # Normalize
+    return output_format.strip().lower()
+
+def _has_children(node) -> bool:
+    return any(isinstance(node.get(key), dict) and len(node.get(key)) > 0
+               for key in ("problems", "subproblems", "sub_subproblems"))
+
+def prefetch_rag_contexts(vector_db, queries):
     """
-    Recursively process the question tree and write to the tex file, with deterministic ordering and numbered headings.
-    ONLY processes nodes where answerable=true
+    Retrieves the top match for every query up front: one batched embedding
+    pass and one FAISS search instead of one of each per leaf.
+    Returns {query: context_text}.
+    """
+    unique = list(dict.fromkeys(queries))
+    if not vector_db or not unique:
+        return {}
+    start = time.perf_counter()
+    hits = vector_db.search(unique, k=1)
+    contexts = {q: (row[0][0].page_content if row else "") for q, row in zip(unique, hits)}
+    print(f"🔍 Prefetched RAG context for {len(unique)} leaves in {time.perf_counter() - start:.2f}s")
+    return contexts
+
+def _problem_num(k: str):
+    m = re.search(r"Problem\s+(\d+)", k)
+    return int(m.group(1)) if m else float('inf')
+
+def _alpha_order(k: str):
+    m = re.search(r"\(?([a-zA-Z])\)?", k)
+    ch = m.group(1).lower() if m else 'z'
+    return ord(ch) - ord('a')
+
+def _roman_to_int(s: str):
+    s = s.strip().lower().rstrip('.')
+    vals = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
+    total = 0
+    prev = 0
+    for ch in reversed(s):
+        val = vals.get(ch, 0)
+        if val < prev:
+            total -= val
+        else:
+            total += val
+            prev = val
+    return total if total > 0 else float('inf')
+
+def _sanitize_math(s: str) -> str:
+    s = s.replace("π", r"\pi")
+    s = s.replace("⋅", r"\cdot")
+    s = s.replace("×", r"\times")
+    s = s.replace("∀", r"\forall")
+    s = s.replace("°", r"^{\circ}")
+    return s
+
+def _image_placeholder(subtitle=""):
+    caption = subtitle if subtitle else "Placeholder for image output"
+    return f"\\begin{{figure}}[H]\\n\\centering\\n\\fbox{{\\rule{{0pt}}{{2in}} \\rule{{0.8\\textwidth}}{{0pt}}}}\\n\\caption{{{caption}}}\\n\\end{{figure}}\\n\\n"
+
+def plan_node(node, labels=None, depth=0, slots=None):
+    """
+    Plan step: walk the question tree in document order (problems by number,
+    subproblems by letter, sub-subproblems by roman numeral) and append its
+    render slots. A slot is either a literal LaTeX string or a
+    {"question": ...} dict that still needs an LLM solution.
+    ONLY plans nodes where answerable=true
     """
     if labels is None:
         labels = []
-
-    import re
-
-    def _problem_num(k: str):
-        m = re.search(r"Problem\s+(\d+)", k)
-        return int(m.group(1)) if m else float('inf')
-
-    def _alpha_order(k: str):
-        m = re.search(r"\(?([a-zA-Z])\)?", k)
-        ch = m.group(1).lower() if m else 'z'
-        return ord(ch) - ord('a')
-
-    def _roman_to_int(s: str):
-        s = s.strip().lower().rstrip('.')
-        vals = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
-        total = 0
-        prev = 0
-        for ch in reversed(s):
-            val = vals.get(ch, 0)
-            if val < prev:
-                total -= val
-            else:
-                total += val
-                prev = val
-        return total if total > 0 else float('inf')
+    if slots is None:
+        slots = []
 
     # CHECK ANSWERABLE STATUS - Skip if answerable=false
     is_answerable = node.get("answerable", True)  # Default to True if not specified
     if not is_answerable:
         print(f"⏭️  Skipping (answerable=false): {node.get('content', 'No content')[:50]}...")
-        return
+        return slots
 
     content = node.get("content")
 
-    children_present = (
-        (isinstance(node.get("problems"), dict) and len(node.get("problems")) > 0) or
-        (isinstance(node.get("subproblems"), dict) and len(node.get("subproblems")) > 0) or
-        (isinstance(node.get("sub_subproblems"), dict) and len(node.get("sub_subproblems")) > 0)
-    )
-
-    def sanitize_math(s: str) -> str:
-        s = s.replace("π", r"\pi")
-        s = s.replace("⋅", r"\cdot")
-        s = s.replace("×", r"\times")
-        s = s.replace("∀", r"\forall")
-        s = s.replace("°", r"^{\circ}")
-        return s
-
     if content:
         section_cmd = "\\section" if depth == 1 else ("\\subsection" if depth == 2 else ("\\subsubsection" if depth == 3 else "\\paragraph"))
         if depth == 1:
             header = " ".join(labels) if labels else "Question"
-            tex_file.write(f"{section_cmd}{{{header}}}\n{content}\n\n")
+            slots.append(f"{section_cmd}{{{header}}}\n{content}\n\n")
         else:
-            import re as _re
-            eq_like = ("=" in content) or ("π" in content) or ("⋅" in content) or ("×" in content) or bool(_re.search(r"\b(sin|cos|tan|log|exp)\b", content))
-            title = f"$ {sanitize_math(content)} $" if eq_like else content
-            tex_file.write(f"{section_cmd}{{{title}}}\n\n")
-
-        if not children_present:
-            # Get output_format from YAML (preferred over output_type)
-            output_format = node.get("output_format", node.get("output_type", ""))
-            
-            # Fallback: infer from content if not specified
-            if not output_format:
-                lc = content.lower()
-                if any(w in lc for w in ["image", "plot", "spectrum", "figure", "magnitude spectrum"]):
-                    output_format = "image"
-                elif any(w in lc for w in ["explain", "comment", "report", "compute", "text"]):
-                    output_format = "text"
-                else:
-                    output_format = "text"
-
-            # Normalize
-            output_format = output_format.strip().lower()
-            print(f"📝 Processing ({output_format}): {content[:50]}...")
-
-            tex_file.write("\\textbf{Solution:}\n\n")
-
-            def _image_placeholder(subtitle=""):
-                caption = subtitle if subtitle else "Placeholder for image output"
-                tex_file.write(f"\\begin{{figure}}[H]\\n\\centering\\n\\fbox{{\\rule{{0pt}}{{2in}} \\rule{{0.8\\textwidth}}{{0pt}}}}\\n\\caption{{{caption}}}\\n\\end{{figure}}\\n\\n")
+            eq_like = ("=" in content) or ("π" in content) or ("⋅" in content) or ("×" in content) or bool(re.search(r"\b(sin|cos|tan|log|exp)\b", content))
+            title = f"$ {_sanitize_math(content)} $" if eq_like else content
+            slots.append(f"{section_cmd}{{{title}}}\n\n")
+
+        if not _has_children(node):
+            output_format = _leaf_output_format(node, content)
+            print(f"📝 Planned ({output_format}): {content[:50]}...")
+
+            slots.append("\\textbf{Solution:}\n\n")
+            subtitle = content[:100] if len(content) <= 100 else content[:97] + "..."
 
             # Handle different output formats
             if output_format in ("image", "figure"):
                 # Image output - leave placeholder with subtitle
-                subtitle = content[:100] if len(content) <= 100 else content[:97] + "..."
-                _image_placeholder(subtitle)
-                
-            elif output_format in ("text", "answer"):
-                # Text output - use RAG to generate answer
-                docs = vector_db.similarity_search(content, k=1) if vector_db else []
-                context_text = docs[0].page_content if docs else ""
-                
-                # DEBUG: Show RAG context retrieval
-                if context_text:
-                    print(f"   🔍 RAG Retrieved {len(context_text)} chars of context")
-                    print(f"   📝 Context preview: {context_text[:100]}...")
-                else:
-                    print(f"   ⚠️  No RAG context found")
-                
-                latex_solution = generate_latex_with_bedrock(bedrock_client, content, context_text)
-                tex_file.write(f"{latex_solution}\n\n")
-                
+                slots.append(_image_placeholder(subtitle))
             elif output_format in ("image+text", "text+image", "both"):
                 # Both image and text
-                subtitle = content[:100] if len(content) <= 100 else content[:97] + "..."
-                _image_placeholder(subtitle)
-                docs = vector_db.similarity_search(content, k=1) if vector_db else []
-                context_text = docs[0].page_content if docs else ""
-                
-                # DEBUG: Show RAG context retrieval
-                if context_text:
-                    print(f"   🔍 RAG Retrieved {len(context_text)} chars of context")
-                    print(f"   📝 Context preview: {context_text[:100]}...")
-                else:
-                    print(f"   ⚠️  No RAG context found")
-                
-                latex_solution = generate_latex_with_bedrock(bedrock_client, content, context_text)
-                tex_file.write(f"{latex_solution}\n\n")
-                
+                slots.append(_image_placeholder(subtitle))
+                slots.append({"question": content})
             else:
-                # Default to text with RAG
-                docs = vector_db.similarity_search(content, k=1) if vector_db else []
-                context_text = docs[0].page_content if docs else ""
-                latex_solution = generate_latex_with_bedrock(bedrock_client, content, context_text)
-                tex_file.write(f"{latex_solution}\n\n")
+                # Text output (and default) - use RAG to generate answer
+                slots.append({"question": content})
 
-        tex_file.write("\\hrule\\vspace{0.5cm}\n\n")
+        slots.append("\\hrule\\vspace{0.5cm}\n\n")
 
-    # Process children in order
+    # Plan children in order
     if "problems" in node and isinstance(node["problems"], dict):
         for k in sorted(node["problems"].keys(), key=_problem_num):
-            process_node(node["problems"][k], vector_db, bedrock_client, tex_file, labels=labels + [k], depth=depth + 1)
+            plan_node(node["problems"][k], labels=labels + [k], depth=depth + 1, slots=slots)
 
     if "subproblems" in node and isinstance(node["subproblems"], dict):
         for k in sorted(node["subproblems"].keys(), key=_alpha_order):
-            process_node(node["subproblems"][k], vector_db, bedrock_client, tex_file, labels=labels + [k], depth=depth + 1)
+            plan_node(node["subproblems"][k], labels=labels + [k], depth=depth + 1, slots=slots)
 
     if "sub_subproblems" in node and isinstance(node["sub_subproblems"], dict):
         for k in sorted(node["sub_subproblems"].keys(), key=_roman_to_int):
-            process_node(node["sub_subproblems"][k], vector_db, bedrock_client, tex_file, labels=labels + [k], depth=depth + 1)
+            plan_node(node["sub_subproblems"][k], labels=labels + [k], depth=depth + 1, slots=slots)
+
+    return slots
 
-def main():
+def fill_solution_slots(slots, vector_db, bedrock_client, contexts=None, max_workers=SOLUTION_WORKERS):
+    """
+    Execute step: generate the LaTeX for every {"question"} slot concurrently,
+    storing it under "latex". Throughput is bounded by the shared Bedrock rate
+    limiter inside generate_latex_with_bedrock, not by the worker count.
+    contexts: optional {question: RAG context} from prefetch_rag_contexts;
+    questions missing from it fall back to a per-question similarity search.
+    """
+    pending = [s for s in slots if isinstance(s, dict)]
+    if not pending:
+        return slots
+
+    def _retrieve_context(text: str) -> str:
+        if contexts is not None and text in contexts:
+            return contexts[text]
+        docs = vector_db.similarity_search(text, k=1) if vector_db else []
+        return docs[0].page_content if docs else ""
+
+    def _solve(slot):
+        context_text = _retrieve_context(slot["question"])
+        slot["latex"] = generate_latex_with_bedrock(bedrock_client, slot["question"], context_text)
+        return bool(context_text)
+
+    no_context = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(_solve, slot): slot for slot in pending}
+        for fut in tqdm(as_completed(futures), total=len(futures), desc="Generating solutions"):
+            try:
+                if not fut.result():
+                    no_context += 1
+            except Exception as e:
+                futures[fut]["latex"] = f"% Error generating solution: {e}"
+    if no_context:
+        print(f"   ⚠️  No RAG context found for {no_context}/{len(pending)} questions")
+    return slots
+
+def render_slots(slots, tex_file):
+    """Render step: write the slots in plan order."""
+    for slot in slots:
+        tex_file.write(slot if isinstance(slot, str) else f"{slot['latex']}\n\n")
+
+def process_node(node, vector_db, bedrock_client, tex_file, labels=None, depth=0, contexts=None):
+    """Plan, generate and write a single question tree."""
+    slots = plan_node(node, labels=labels, depth=depth)
+    fill_solution_slots(slots, vector_db, bedrock_client, contexts=contexts)
+    render_slots(slots, tex_file)
+
+def main(questions_dir=QUESTIONS_DIR, rag_index_path=RAG_INDEX_PATH, output_tex_file=OUTPUT_TEX_FILE):
+    """Writes output_tex_file for the YAML trees in questions_dir; returns its path, or None on failure."""
     print("Initializing Amazon Bedrock Client...")
     bedrock_client = None
     try:
@@ -314,19 +374,18 @@ def main():
         bedrock_client = None
 
     try:
-        vector_db = load_rag_index(RAG_INDEX_PATH)
+        vector_db = load_rag_index(rag_index_path)
         print("✅ RAG index loaded successfully")
     except Exception as e:
         print(f"Failed to load RAG: {e}")
         return
 
-    if not os.path.exists(QUESTIONS_DIR):
-        print(f"Questions directory not found: {QUESTIONS_DIR}")
+    if not os.path.exists(questions_dir):
+        print(f"Questions directory not found: {questions_dir}")
         return
 
     # Get all YAML files and sort them numerically
-    import re
-    yaml_files = [f for f in os.listdir(QUESTIONS_DIR) if f.endswith('.yaml') or f.endswith('.yml')]
+    yaml_files = [f for f in os.listdir(questions_dir) if f.endswith('.yaml') or f.endswith('.yml')]
     
     def extract_number(filename):
         """Extract number from filename like 'parsed_question_1.yaml' -> 1"""
@@ -336,13 +395,48 @@ def main():
     yaml_files.sort(key=extract_number)
     
     if not yaml_files:
-        print(f"No YAML files found in {QUESTIONS_DIR}")
+        print(f"No YAML files found in {questions_dir}")
         return
     
     print(f"\n📁 Found {len(yaml_files)} YAML file(s): {', '.join(yaml_files)}")
     print(f"{'='*60}\n")
 
-    with open(OUTPUT_TEX_FILE, "w", encoding="utf-8") as tex_file:
+    # Plan: load every tree and lay out its render slots in document order
+    slots = []
+    for yaml_file in yaml_files:
+        print(f"\n{'='*60}")
+        print(f"📄 Planning: {yaml_file}")
+        print(f"{'='*60}")
+
+        try:
+            with open(os.path.join(questions_dir, yaml_file), 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f)
+
+            if data:
+                print(f"✓ Loaded data keys: {list(data.keys())}")
+                file_slots = plan_node(data, labels=[])
+            else:
+                print(f"⚠️  Warning: No data in {yaml_file}")
+                file_slots = []
+        except Exception as e:
+            print(f"❌ Error processing {yaml_file}: {e}")
+            file_slots = [f"\n% Error processing {yaml_file}: {e}\n\n"]
+        slots.extend(file_slots)
+
+    # Retrieve context for all questions in one batch
+    contexts = None
+    if vector_db is not None and os.getenv("RAG_PREFETCH", "1") != "0":
+        queries = [slot["question"] for slot in slots if isinstance(slot, dict)]
+        try:
+            contexts = prefetch_rag_contexts(vector_db, queries)
+        except Exception as e:
+            print(f"⚠️  Batched RAG retrieval failed ({e}); retrieving per question")
+
+    # Execute: all LLM slots concurrently, under the shared rate limit
+    fill_solution_slots(slots, vector_db, bedrock_client, contexts=contexts)
+
+    # Render: stream the document out in plan order
+    with open(output_tex_file, "w", encoding="utf-8") as tex_file:
         # Write Header
         tex_file.write(r"""\documentclass{article}
 \usepackage{amsmath}
@@ -362,32 +456,18 @@ def main():
 
 """)
         
-        # Process each YAML file sequentially
-        for yaml_file in yaml_files:
-            f_path = os.path.join(QUESTIONS_DIR, yaml_file)
-            print(f"\n{'='*60}")
-            print(f"📄 Processing: {yaml_file}")
-            print(f"{'='*60}")
-            
-            try:
-                with open(f_path, 'r', encoding='utf-8') as f:
-                    data = yaml.safe_load(f)
-                
-                if data:
-                    print(f"✓ Loaded data keys: {list(data.keys())}")
-                    process_node(data, vector_db, bedrock_client, tex_file, labels=[])
-                else:
-                    print(f"⚠️  Warning: No data in {yaml_file}")
-            except Exception as e:
-                print(f"❌ Error processing {yaml_file}: {e}")
-                tex_file.write(f"\n% Error processing {yaml_file}: {e}\n\n")
+        render_slots(slots, tex_file)
 
         # Write Footer
         tex_file.write(r"\end{document}")
 
     print(f"\n{'='*60}")
-    print(f"✅ Solution generated: {OUTPUT_TEX_FILE}")
+    print(f"✅ Solution generated: {output_tex_file}")
+    print(llm_cache.report())
+    if hasattr(vector_db, "report"):
+        print(vector_db.report())
     print(f"{'='*60}\n")
+    return output_tex_file
 
 if __name__ == "__main__":
     main()
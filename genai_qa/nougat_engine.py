@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+
+import fitz  # PyMuPDF
+from tqdm.auto import tqdm
+
+from llm_cache import LLMCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+os.environ.setdefault("NO_ALBUMENTATIONS_UPDATE", "1")
+
+NOUGAT_MODEL_TAG = os.getenv("NOUGAT_MODEL_TAG", "0.1.0-small")
+NOUGAT_BATCH_SIZE = int(os.getenv("NOUGAT_BATCH_SIZE", "4"))
+# Same rasterization resolution the nougat CLI uses for PDF pages
+NOUGAT_DPI = 96
+
+# OCR output keyed by the rendered crop, so re-runs and pages shared between
+# PDFs (cover sheets, instructions) never reach the model twice
+ocr_cache = LLMCache(
+    os.getenv("OCR_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "ocr")),
+    max_bytes=int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    max_age=float(os.getenv("OCR_CACHE_MAX_AGE", str(90 * 24 * 3600))),
+    bypass=os.getenv("OCR_CACHE_BYPASS", "0") == "1",
+    name="OCR cache",
+)
+
+
+def cleanup_mmd(mmd_text):
+    if not isinstance(mmd_text, str): return ""
+    latex = mmd_text.replace("$$", "\n\\[\n")
+    latex = latex.replace("$", "\\(")
+    latex = latex.replace("\\(\n\\[\n", "\\[")
+    latex = latex.replace("\\]\n\\)", "\\]")
+    return latex.strip()
+
+
+class NougatEngine:
+    """
+    In-process Nougat OCR. The checkpoint is loaded once (lazily, on first
+    predict) and section crops are fed as batched image tensors, instead of
+    writing one temp PDF per section and spawning the nougat CLI for each.
+    """
+
+    def __init__(self, device="cpu", model_tag=NOUGAT_MODEL_TAG, batch_size=NOUGAT_BATCH_SIZE, dpi=NOUGAT_DPI):
+        self.device = device
+        self.model_tag = model_tag
+        self.batch_size = max(1, batch_size)
+        self.dpi = dpi
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.model is not None:
+                return self.model
+            # Heavy imports stay local so importing this module is cheap
+            from nougat import NougatModel
+            from nougat.utils.checkpoint import get_checkpoint
+            from nougat.utils.device import move_to_device
+
+            checkpoint = get_checkpoint(None, model_tag=self.model_tag)
+            model = NougatModel.from_pretrained(checkpoint)
+            model = move_to_device(model, bf16=self.device == "cuda", cuda=self.device == "cuda")
+            model.eval()
+            self.model = model
+            return model
+
+    def render_crop(self, doc, page_index, clip_rect):
+        """Rasterize a clip of an open fitz document straight to a PIL image."""
+        from PIL import Image
+
+        pix = doc[page_index].get_pixmap(clip=clip_rect, dpi=self.dpi, alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    def crop_key(self, image):
+        """Cache key for a rendered crop: pixel hash + geometry + model version."""
+        pixels = hashlib.sha256(image.tobytes()).hexdigest()
+        return LLMCache.make_key(f"nougat:{self.model_tag}", {"pixels": pixels, "size": list(image.size), "dpi": self.dpi})
+
+    def predict(self, images):
+        """OCR a list of PIL images; returns one markdown string per image ('' if Nougat gave up)."""
+        import torch
+        from nougat.postprocessing import markdown_compatible
+
+        model = self.load()
+        outputs = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            tensors = torch.stack([model.encoder.prepare_input(img, random_padding=False) for img in chunk])
+            with torch.inference_mode():
+                result = model.inference(image_tensors=tensors, early_stopping=False)
+            for pred in result["predictions"]:
+                pred = pred.strip()
+                outputs.append("" if pred.startswith("[MISSING_PAGE") else markdown_compatible(pred))
+        return outputs
+
+
+def parse_sections_with_nougat(sections_list, original_pdf_path, engine=None, cache=ocr_cache):
+    """
+    Adds "latex_content" to every section: Nougat OCR of the full-width strip
+    covering the section bbox, or cleanup_mmd(s["text"]) when OCR is
+    unavailable or returns nothing for that section. Crops already in the
+    OCR cache skip the model; only successful OCR results are cached.
+    """
+    print(f"Starting Nougat parsing for {len(sections_list)} sections.")
+    engine = engine or NougatEngine()
+
+    doc = fitz.open(original_pdf_path)
+    parsed_sections = []
+    nougat_ok = True
+
+    batches = [sections_list[b:b + engine.batch_size] for b in range(0, len(sections_list), engine.batch_size)]
+    for batch in tqdm(batches):
+        texts = [None] * len(batch)
+        try:
+            images = []
+            for s in batch:
+                page = doc[s["page_start"] - 1]
+                rect = fitz.Rect(s["bbox"])
+                clip_rect = fitz.Rect(0, rect.y0, page.rect.width, rect.y1)
+                images.append(engine.render_crop(doc, page.number, clip_rect))
+            keys = [engine.crop_key(img) for img in images]
+            texts = [cache.get(k) for k in keys]
+
+            todo = [j for j, t in enumerate(texts) if t is None]
+            if todo and nougat_ok:
+                predictions = engine.predict([images[j] for j in todo])
+                for j, pred in zip(todo, predictions):
+                    if pred:
+                        texts[j] = cleanup_mmd(pred)
+                        cache.put(keys[j], texts[j])
+        except ImportError as e:
+            # Nougat (or torch) not installed: plain-text fallback for what the cache can't serve
+            print(f"⚠️ Nougat unavailable ({e}). Falling back to extracted text.")
+            nougat_ok = False
+        except Exception as e:
+            print(f"Error running Nougat on sections {[s['id'] for s in batch]}: {e}")
+
+        for s, text in zip(batch, texts):
+            s["latex_content"] = text if text else cleanup_mmd(s["text"])
+            parsed_sections.append(s)
+
+    doc.close()
+    return parsed_sections
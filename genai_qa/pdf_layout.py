@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+
+# Below this many pages a process pool costs more than it saves
+MIN_PAGES_PER_WORKER = 8
+
+
+def _extract_page_range(task):
+    """
+    Worker: open the PDF independently and extract spans for pages [start, stop).
+    Returns columnar arrays; span texts are packed into one string with an
+    offsets table and fonts are dictionary-encoded, so results pickle cheaply.
+    """
+    pdf_path, start, stop = task
+    page, x0, y0, x1, y1, size, bold, font_code = ([] for _ in range(8))
+    texts, offsets, fonts = [], [0], {}
+    with fitz.open(pdf_path) as doc:
+        for pno in range(start, stop):
+            for b in doc[pno].get_text("dict")["blocks"]:
+                if "lines" not in b: continue
+                for l in b["lines"]:
+                    for s in l["spans"]:
+                        t = s["text"].strip()
+                        if not t: continue
+                        bx0, by0, bx1, by1 = s["bbox"]
+                        page.append(pno + 1)
+                        x0.append(bx0); y0.append(by0); x1.append(bx1); y1.append(by1)
+                        size.append(s["size"])
+                        bold.append("Bold" in s["font"])
+                        font_code.append(fonts.setdefault(s["font"], len(fonts)))
+                        texts.append(t)
+                        offsets.append(offsets[-1] + len(t))
+    return {
+        "page": np.asarray(page, dtype=np.int64),
+        "bbox": np.column_stack([x0, y0, x1, y1]) if page else np.empty((0, 4)),
+        "size": np.asarray(size, dtype=float),
+        "bold": np.asarray(bold, dtype=bool),
+        "font_code": np.asarray(font_code, dtype=np.int32),
+        "fonts": list(fonts),
+        "text": "".join(texts),
+        "text_offsets": np.asarray(offsets, dtype=np.int64),
+    }
+
+
+def _pool_context():
+    if "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def extract_spans(pdf_path, workers=None):
+    """
+    Extracts every non-empty text span of the PDF into a DataFrame with the
+    columns page, text, x0, y0, x1, y1, font, size, bold.
+
+    Pages are sharded into contiguous ranges, one per worker process; each
+    worker opens the document itself and returns columnar arrays that are
+    concatenated back in page order. Small documents are extracted in-process.
+    Workers are forked when the caller is single-threaded and spawned
+    otherwise (forking a threaded process, e.g. under pipeline.py, can
+    deadlock); spawning is safe because the stage scripts only do work
+    under `if __name__ == "__main__"`.
+    """
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, n_pages // MIN_PAGES_PER_WORKER))
+
+    bounds = np.linspace(0, n_pages, workers + 1).astype(int)
+    tasks = [(pdf_path, int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    if workers == 1:
+        chunks = [_extract_page_range(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+            chunks = list(pool.map(_extract_page_range, tasks))
+
+    texts, fonts = [], []
+    for c in chunks:
+        offs = c["text_offsets"]
+        texts.extend(c["text"][offs[k]:offs[k + 1]] for k in range(len(offs) - 1))
+        lookup = np.asarray(c["fonts"], dtype=object)
+        fonts.append(lookup[c["font_code"]] if len(lookup) else np.empty(0, dtype=object))
+
+    bbox = np.concatenate([c["bbox"] for c in chunks]) if chunks else np.empty((0, 4))
+    return pd.DataFrame({
+        "page": np.concatenate([c["page"] for c in chunks]) if chunks else np.empty(0, dtype=np.int64),
+        "text": texts,
+        "x0": bbox[:, 0], "y0": bbox[:, 1], "x1": bbox[:, 2], "y1": bbox[:, 3],
+        "font": np.concatenate(fonts) if fonts else np.empty(0, dtype=object),
+        "size": np.concatenate([c["size"] for c in chunks]) if chunks else np.empty(0),
+        "bold": np.concatenate([c["bold"] for c in chunks]) if chunks else np.empty(0, dtype=bool),
+    })
+
+
+def group_lines(df, y_gap=5):
+    """
+    Merges PyMuPDF spans into text lines.
+
+    Spans are sorted by (page, y0) and a new line starts whenever the page
+    changes or a span's y0 is at least y_gap below the previous span's y1.
+    Everything runs on NumPy arrays: run boundaries come from np.diff, and
+    bbox/size/bold per line from ufunc.reduceat over the run starts.
+    The sort is stable, so spans sharing a y0 keep their extraction
+    (reading) order, and size is the mean font size of the line's spans.
+    """
+    if df is None or df.empty:
+        return []
+
+    page = df["page"].to_numpy()
+    y0 = df["y0"].to_numpy(dtype=float)
+    order = np.lexsort((y0, page))
+
+    page = page[order]
+    x0 = df["x0"].to_numpy(dtype=float)[order]
+    y0 = y0[order]
+    x1 = df["x1"].to_numpy(dtype=float)[order]
+    y1 = df["y1"].to_numpy(dtype=float)[order]
+    bold = df["bold"].to_numpy(dtype=bool)[order]
+    text = df["text"].to_numpy(dtype=object)[order]
+    size = df["size"].to_numpy(dtype=float)[order]
+
+    # Written as "not (gap < y_gap)" so NaN coordinates break the line like the old loop did
+    new_line = np.empty(len(page), dtype=bool)
+    new_line[0] = True
+    new_line[1:] = (np.diff(page) != 0) | ~((y0[1:] - y1[:-1]) < y_gap)
+
+    starts = np.flatnonzero(new_line)
+    ends = np.append(starts[1:], len(page))
+    counts = ends - starts
+
+    line_page = page[starts].tolist()
+    lx0 = np.minimum.reduceat(x0, starts).tolist()
+    ly0 = np.minimum.reduceat(y0, starts).tolist()
+    lx1 = np.maximum.reduceat(x1, starts).tolist()
+    ly1 = np.maximum.reduceat(y1, starts).tolist()
+    lsize = (np.add.reduceat(size, starts) / counts).tolist()
+    lbold = np.logical_or.reduceat(bold, starts).tolist()
+
+    out = []
+    for k, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        out.append({
+            "page": line_page[k],
+            "bbox": [lx0[k], ly0[k], lx1[k], ly1[k]],
+            "text": " ".join(text[s:e]),
+            "size": lsize[k],
+            "bold": lbold[k]
+        })
+    return out
@@ -0,0 +1,446 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.getenv("PIPELINE_STATE_DIR", os.path.join(BASE_DIR, ".cache", "pipeline"))
+# Stages allowed to run at the same time
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+
+DEFAULT_PDF = os.path.join(BASE_DIR, "input_pdf", "DIP_3.pdf")
+DEFAULT_NOTEBOOK_JSON = os.path.join(BASE_DIR, "Jupyter file", "ans_parsed.json")
+
+
+def path_digest(path):
+    """sha256 over a file's bytes, or over every file (relative path + bytes) under a directory."""
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).replace(os.sep, "/").encode("utf-8") + b"\0")
+                h.update(path_digest(full).encode("ascii"))
+    elif os.path.isfile(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        return "missing"
+    return h.hexdigest()
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    run(values) receives the in-memory results of the stages named in deps
+    ({dep name: value}) and returns this stage's value; it must also write
+    `outputs`, which persist the value across runs. load() rebuilds the value
+    from those outputs when the stage is skipped but a downstream stage
+    needs it. The stage is skipped when its fingerprint - params, the bytes
+    of `inputs` and `code`, and the output bytes of its deps - matches the
+    last successful run and every output still exists.
+    """
+
+    def __init__(self, name, run, deps=(), inputs=(), outputs=(), code=(), params=None, load=None):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.code = tuple(code)
+        self.params = params or {}
+        self.load = load
+
+    def fingerprint(self, dep_digests):
+        h = hashlib.sha256()
+        h.update(json.dumps({"stage": self.name, "params": self.params}, sort_keys=True, default=str).encode("utf-8"))
+        for path in self.inputs + self.code:
+            h.update(f"\0{os.path.basename(path)}\0{path_digest(path)}".encode("utf-8"))
+        for dep in self.deps:
+            h.update(f"\0{dep}\0{dep_digests[dep]}".encode("utf-8"))
+        return h.hexdigest()
+
+    def outputs_digest(self):
+        h = hashlib.sha256()
+        for path in self.outputs:
+            h.update(f"\0{path_digest(path)}".encode("utf-8"))
+        return h.hexdigest()
+
+
+class Pipeline:
+    """
+    Runs a DAG of Stages. Stages whose deps are done are started together on
+    a thread pool, so independent branches (the PDF chain and the RAG build)
+    overlap; results are handed to downstream stages in memory. Fingerprints
+    of the last successful run are kept in <state_dir>/<stage>.json.
+    """
+
+    def __init__(self, stages, state_dir=STATE_DIR):
+        self.stages = {s.name: s for s in stages}
+        self.state_dir = state_dir
+        for s in stages:
+            for dep in s.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {s.name!r} depends on unknown stage {dep!r}")
+        self._values = {}
+        self._digests = {}
+        self._locks = {name: threading.Lock() for name in self.stages}
+
+    def _state_path(self, name):
+        return os.path.join(self.state_dir, f"{name}.json")
+
+    def _saved_fingerprint(self, name):
+        try:
+            with open(self._state_path(name), "r", encoding="utf-8") as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+
+    def _save_fingerprint(self, name, fingerprint, seconds):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp = f"{self._state_path(name)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "seconds": round(seconds, 3), "finished": time.time()}, f)
+        os.replace(tmp, self._state_path(name))
+
+    def closure(self, targets):
+        """targets plus everything they depend on, in topological order."""
+        order, seen = [], set()
+
+        def visit(name, path=()):
+            if name in path:
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + (name,))}")
+            if name in seen:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name!r}")
+            for dep in self.stages[name].deps:
+                visit(dep, path + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for t in targets:
+            visit(t)
+        return order
+
+    def value(self, name):
+        """In-memory value of a finished stage, loaded from its outputs if it was skipped."""
+        with self._locks[name]:
+            if name not in self._values:
+                stage = self.stages[name]
+                self._values[name] = stage.load() if stage.load else None
+            return self._values[name]
+
+    def _execute(self, name, force):
+        stage = self.stages[name]
+        fingerprint = stage.fingerprint(self._digests)
+        if (name not in force and fingerprint == self._saved_fingerprint(name)
+                and all(os.path.exists(p) for p in stage.outputs)):
+            return "skipped", 0.0
+
+        start = time.perf_counter()
+        value = stage.run({dep: self.value(dep) for dep in stage.deps})
+        seconds = time.perf_counter() - start
+        with self._locks[name]:
+            self._values[name] = value
+        self._save_fingerprint(name, fingerprint, seconds)
+        return "ran", seconds
+
+    def run(self, targets=None, force=(), workers=PIPELINE_WORKERS, keep_going=False):
+        """
+        Brings targets (default: every stage) up to date. force names stages
+        to re-run regardless of their fingerprint; "all" forces every stage.
+        A failing stage raises once running stages finish, unless keep_going,
+        in which case it is reported as "failed", everything downstream of it
+        as "blocked", and independent stages carry on.
+        Returns {stage: (status, seconds)}.
+        """
+        order = self.closure(targets or list(self.stages))
+        force = set(order) if "all" in force else set(force)
+        remaining = {name: set(self.stages[name].deps) for name in order}
+        report = {}
+        failed = set()
+
+        print(f"Pipeline: {' -> '.join(order)} ({workers} worker(s))")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            running = {}
+            while remaining or running:
+                ready = [n for n, deps in remaining.items() if not deps]
+                while ready:
+                    name = ready.pop(0)
+                    del remaining[name]
+                    if failed.intersection(self.stages[name].deps):
+                        failed.add(name)
+                        report[name] = ("blocked", 0.0)
+                        for other, deps in remaining.items():
+                            deps.discard(name)
+                            if not deps and other not in ready:
+                                ready.append(other)
+                        continue
+                    print(f"▶ {name}")
+                    running[pool.submit(self._execute, name, force)] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status, seconds = future.result()
+                    except Exception as e:
+                        if not keep_going:
+                            print(f"❌ Stage {name} failed; waiting for running stages to finish.")
+                            for f in running:
+                                f.cancel()
+                            raise
+                        print(f"❌ Stage {name} failed: {e}")
+                        failed.add(name)
+                        report[name] = ("failed", 0.0)
+                    else:
+                        self._digests[name] = self.stages[name].outputs_digest()
+                        report[name] = (status, seconds)
+                        print(f"✅ {name}: {status}" + (f" in {seconds:.1f}s" if status == "ran" else " (up to date)"))
+                    for deps in remaining.values():
+                        deps.discard(name)
+
+        width = max(len(n) for n in order)
+        print("\nStage summary:")
+        for name in order:
+            status, seconds = report[name]
+            print(f"  {name:<{width}} {status:<8} {seconds:>8.1f}s")
+        return report
+
+
+# ==========================================
+# genai_qa stages
+# ==========================================
+
+def _save_df(df, base_path):
+    from block_store import save_blocks
+
+    save_blocks(df, base_path)
+
+
+def _load_df(base_path):
+    from block_store import load_blocks
+
+    return load_blocks(f"{base_path}.parquet")
+
+
+def _code(*names):
+    return [os.path.join(BASE_DIR, n) for n in names]
+
+
+def _add_path(path):
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+def assignment_stages(pdf_path, work_dir, tag=""):
+    """
+    Stages that only depend on the assignment PDF; outputs go under work_dir
+    with the names the standalone scripts use. tag is appended to every
+    stage name so several assignments can share one Pipeline.
+
+        extract -> classify -> link -> questions
+        extract -> preclassify   (per-block Bedrock labels; only on request)
+    """
+    blocks_path = os.path.join(work_dir, "export_for_kaggle", "all_blocks_for_classification")
+    classified_path = os.path.join(work_dir, "all_blocks_classified")
+    linked_path = os.path.join(work_dir, "qwen_debug_full_outputs")
+    preclassified_dir = os.path.join(work_dir, "classifiedBlocksOutput")
+    questions_dir = os.path.join(work_dir, "yaml_parsed_questions")
+    extract_name, classify_name, link_name = f"extract{tag}", f"classify{tag}", f"link{tag}"
+
+    def extract(values):
+        import preclassification
+
+        df = preclassification.extract_blocks(pdf_path, vis_dir=work_dir)
+        if df.empty:
+            raise RuntimeError(f"No blocks extracted from {pdf_path}")
+        _save_df(df, blocks_path)
+        return df
+
+    def preclassify(values):
+        import preclassification
+
+        df = preclassification.preclassify_blocks(values[extract_name].copy())
+        preclassification.export_blocks(df, preclassified_dir)
+        return df
+
+    def classify(values):
+        import classifyAllBlocks
+
+        df = classifyAllBlocks.classify_blocks(values[extract_name])
+        _save_df(df, classified_path)
+        return df
+
+    def link(values):
+        import classifyAllBlocks
+
+        df = classifyAllBlocks.link_questions(values[classify_name])
+        if df.empty:
+            raise RuntimeError("No 'question' or 'technical' blocks to link")
+        _save_df(df, linked_path)
+        return df
+
+    def questions(values):
+        from extractQuestionFromCsv import extract_questions, write_question_yamls
+
+        texts = extract_questions(values[link_name])
+        print(f"Successfully extracted {len(texts)} questions.")
+        write_question_yamls(texts, questions_dir)
+        return questions_dir
+
+    return [
+        Stage(extract_name, extract, inputs=[pdf_path], outputs=[f"{blocks_path}.parquet"],
+              code=_code("preclassification.py", "pdf_layout.py", "nougat_engine.py", "block_rules.py", "block_store.py"),
+              load=lambda: _load_df(blocks_path)),
+        Stage(f"preclassify{tag}", preclassify, deps=[extract_name],
+              outputs=[os.path.join(preclassified_dir, "classified_blocks.parquet")],
+              code=_code("preclassification.py", "block_store.py"),
+              load=lambda: _load_df(os.path.join(preclassified_dir, "classified_blocks"))),
+        Stage(classify_name, classify, deps=[extract_name], outputs=[f"{classified_path}.parquet"],
+              code=_code("classifyAllBlocks.py", "block_rules.py", "block_store.py"),
+              params={"batch_size": os.getenv("CLASSIFY_BATCH_SIZE", "10"),
+                      "rules": os.getenv("RULE_CLASSIFIER", "1"),
+                      "rule_threshold": os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.9")},
+              load=lambda: _load_df(classified_path)),
+        Stage(link_name, link, deps=[classify_name], outputs=[f"{linked_path}.parquet"],
+              code=_code("classifyAllBlocks.py", "block_store.py"),
+              params={"single_call": os.getenv("LINK_SINGLE_CALL", "0")},
+              load=lambda: _load_df(linked_path)),
+        Stage(f"questions{tag}", questions, deps=[link_name], outputs=[questions_dir],
+              code=_code("extractQuestionFromCsv.py", "subpart_split.py"),
+              load=lambda: questions_dir),
+    ]
+
+
+def _rag_params():
+    """Embedding model and chunk size, which shape the index and queries but live in code."""
+    _add_path(os.path.join(BASE_DIR, "RAG"))
+    try:
+        from embeddings import EMBEDDING_MODEL
+        from hybrid import CHUNK_CHARS
+    except ImportError:
+        return {}
+    return {"embedding_model": EMBEDDING_MODEL, "chunk_chars": CHUNK_CHARS}
+
+
+def solution_stages(questions_stage, notebook, work_dir, rag_index=None, tag=""):
+    """
+    Stages that answer one notebook against the questions produced by
+    questions_stage; outputs go under work_dir (the index to rag_index,
+    default <work_dir>/faiss_index). notebook is a parsed-notebook JSON, or
+    an .ipynb that is parsed first.
+
+        [parse_notebook ->] build_rag -> generate -> compile
+    """
+    rag_index = rag_index or os.path.join(work_dir, "faiss_index")
+    tex_file = os.path.join(work_dir, "solution.tex")
+    pdf_file = os.path.splitext(tex_file)[0] + ".pdf"
+    build_name, generate_name = f"build_rag{tag}", f"generate{tag}"
+    stages = []
+
+    if notebook.endswith(".ipynb"):
+        parse_name = f"parse_notebook{tag}"
+        notebook_json = os.path.join(work_dir, os.path.splitext(os.path.basename(notebook))[0] + "_parsed.json")
+
+        def parse_notebook(values):
+            _add_path(os.path.join(BASE_DIR, "Notebook Processing"))
+            from notebook_parser import save_parsed_notebook
+
+            os.makedirs(work_dir, exist_ok=True)
+            save_parsed_notebook(notebook, notebook_json)
+            return notebook_json
+
+        stages.append(Stage(parse_name, parse_notebook, inputs=[notebook], outputs=[notebook_json],
+                            code=_code(os.path.join("Notebook Processing", "notebook_parser.py")),
+                            load=lambda: notebook_json))
+        rag_deps, rag_inputs = [parse_name], []
+    else:
+        notebook_json = notebook
+        rag_deps, rag_inputs = [], [notebook]
+
+    def build_rag(values):
+        _add_path(os.path.join(BASE_DIR, "RAG"))
+        from rag_implementation import build_rag_database
+
+        build_rag_database(notebook_json, rag_index)
+        return rag_index
+
+    def generate(values):
+        import generate_solution
+
+        if generate_solution.main(values[questions_stage], values[build_name], tex_file) is None:
+            raise RuntimeError("Solution generation failed")
+        return tex_file
+
+    def compile_pdf(values):
+        from compile_pdf import compile_tex_to_pdf
+
+        if not compile_tex_to_pdf(values[generate_name]):
+            raise RuntimeError("PDF compilation failed")
+        return pdf_file
+
+    rag_code = [os.path.join("RAG", n) for n in ("rag_implementation.py", "retriever.py", "hybrid.py", "embeddings.py", "index_store.py")]
+    rag_params = _rag_params()
+    return stages + [
+        Stage(build_name, build_rag, deps=rag_deps, inputs=rag_inputs, outputs=[rag_index],
+              code=_code(*rag_code),
+              params=rag_params,
+              load=lambda: rag_index),
+        Stage(generate_name, generate, deps=[questions_stage, build_name], outputs=[tex_file],
+              code=_code("generate_solution.py", "rate_limiter.py", "llm_cache.py", *rag_code[1:]),
+              params={**rag_params,
+                      "retrieval_mode": os.getenv("RAG_RETRIEVAL_MODE", "vector"),
+                      "prefetch": os.getenv("RAG_PREFETCH", "1")},
+              load=lambda: tex_file),
+        Stage(f"compile{tag}", compile_pdf, deps=[generate_name], outputs=[pdf_file],
+              code=_code("compile_pdf.py"),
+              load=lambda: pdf_file),
+    ]
+
+
+def build_pipeline(pdf_path=DEFAULT_PDF, notebook_json=DEFAULT_NOTEBOOK_JSON, work_dir=BASE_DIR):
+    """
+    The assignment pipeline for one (PDF, notebook) pair as a DAG, writing
+    to the same paths as the standalone scripts.
+
+        extract -> classify -> link -> questions --\\
+                         build_rag -----------------> generate -> compile
+    """
+    return Pipeline(assignment_stages(pdf_path, work_dir)
+                    + solution_stages("questions", notebook_json, work_dir,
+                                      rag_index=os.path.join(work_dir, "RAG", "faiss_index")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the genai_qa pipeline, skipping stages whose inputs are unchanged.")
+    parser.add_argument("targets", nargs="*", default=["generate"],
+                        help="stages to bring up to date (default: generate); add 'compile' for the PDF")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="assignment PDF")
+    parser.add_argument("--notebook-json", default=DEFAULT_NOTEBOOK_JSON, help="notebook for the RAG index (parsed JSON, or .ipynb to parse first)")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STAGE",
+                        help="re-run these stages even if up to date ('all' for every stage)")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="stages run concurrently")
+    parser.add_argument("--list", action="store_true", help="print the stages and exit")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(args.pdf, args.notebook_json)
+    if args.list:
+        for stage in pipeline.stages.values():
+            print(f"{stage.name:<16} <- {', '.join(stage.deps) or '-'}")
+        return
+    pipeline.run(args.targets, force=args.force, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
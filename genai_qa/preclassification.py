@@ -2,35 +2,23 @@
 import fitz  # PyMuPDF
 import pandas as pd
 import numpy as np
-import re
 import json
+import io
 import os
-import subprocess
-import time
-import random
-import boto3
+import threading
 from tqdm.auto import tqdm
-from botocore.exceptions import ClientError
-import torch
-env_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Notebook Processing", ".env")
-if os.path.exists(env_file_path):
-    with open(env_file_path, "r", encoding="utf-8") as _f:
-        for _line in _f:
-            _line = _line.strip()
-            if not _line or _line.startswith("#"): 
-                continue
-            if "=" in _line:
-                _k, _v = _line.split("=", 1)
-                _v = _v.strip().strip('"').strip("'")
-                os.environ.setdefault(_k.strip(), _v)
-    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+from pdf_layout import extract_spans, group_lines
+import block_store
+from block_rules import MARKS_RE, SECTION_START_RE
+from nougat_engine import NougatEngine, parse_sections_with_nougat, ocr_cache
+from rate_limiter import bedrock_limiter
+from llm_cache import llm_cache
+from env_file import load_env_file
 
 # ==========================================
 # 1. SETUP & CONFIGURATION
 # ==========================================
 
-# Set environment variable for Nougat
-os.environ["NO_ALBUMENTATIONS_UPDATE"] = "1"
 input_dir = "input_pdf/"
 filename = "DIP_3.pdf"
 # Define the PDF path
@@ -40,79 +28,48 @@ pdf_path = input_dir + filename
 BEDROCK_REGION = "us-east-1"
 BEDROCK_MODEL_ID = "meta.llama3-70b-instruct-v1:0"
 
-# Check GPU Availability
-device = "cuda" if torch.cuda.is_available() else "cpu"
-if device == "cuda":
-    print(f"✅ GPU Detected: {torch.cuda.get_device_name(0)}")
-else:
-    print("⚠️ GPU Not Detected. Nougat will run on CPU (slower).")
+# Processes used for span extraction (default: one per core, small PDFs stay in-process)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or None
+
+def detect_device():
+    """Torch device for Nougat: CUDA when available, else CPU."""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        print(f"✅ GPU Detected: {torch.cuda.get_device_name(0)}")
+    else:
+        print("⚠️ GPU Not Detected. Nougat will run on CPU (slower).")
+    return device
 
 # ==========================================
 # 2. PDF TEXT EXTRACTION (PyMuPDF)
 # ==========================================
 
-records = []
-try:
-    if not os.path.exists(pdf_path):
-        print(f"❌ Error: File not found at {pdf_path}")
-        # Create dummy file for testing flow if needed, or exit
-    else:
-        with fitz.open(pdf_path) as doc:
-            for pno, page in enumerate(doc, start=1):
-                for b in page.get_text("dict")["blocks"]:
-                    if "lines" not in b: continue
-                    for l in b["lines"]:
-                        for s in l["spans"]:
-                            t = s["text"].strip()
-                            if not t: continue
-                            x0,y0,x1,y1 = s["bbox"]
-                            records.append({
-                                "page": pno,
-                                "text": t,
-                                "x0": x0, "y0": y0, "x1": x1, "y1": y1,
-                                "font": s["font"], "size": s["size"],
-                                "bold": "Bold" in s["font"]
-                            })
-        df = pd.DataFrame(records)
+def load_spans(pdf_path):
+    """Text spans of the PDF (empty DataFrame if it is missing or unreadable)."""
+    try:
+        if not os.path.exists(pdf_path):
+            print(f"❌ Error: File not found at {pdf_path}")
+            return pd.DataFrame()
+        # Page ranges are extracted in parallel worker processes
+        df = extract_spans(pdf_path, workers=EXTRACT_WORKERS)
         if not df.empty:
             df["mid_y"] = (df.y0 + df.y1)/2
             print(f"Extracted {len(df)} text spans.")
         else:
             print("⚠️ No text extracted from PDF.")
-
-except Exception as e:
-    print(f"Error opening or processing PDF: {e}")
+        return df
+    except Exception as e:
+        print(f"Error opening or processing PDF: {e}")
+        return pd.DataFrame()
 
 # ==========================================
 # 3. GROUPING & SECTION DETECTION
 # ==========================================
 
-def group_lines(df, y_gap=5):
-    lines=[]
-    for page, grp in df.groupby("page"):
-        grp=grp.sort_values("y0")
-        if grp.empty: continue
-        buf=[grp.iloc[0]]
-        for _,r in list(grp.iterrows())[1:]:
-            if r.y0 - buf[-1].y1 < y_gap:
-                buf.append(r)
-            else:
-                if buf: lines.append(buf); buf=[r]
-        if buf: lines.append(buf)
-    out=[]
-    for ln in lines:
-        if not ln: continue
-        x0=min(l.x0 for l in ln); y0=min(l.y0 for l in ln)
-        x1=max(l.x1 for l in ln); y1=max(l.y1 for l in ln)
-        out.append({
-            "page":ln[0].page,
-            "bbox":[x0,y0,x1,y1],
-            "text":" ".join(l.text for l in ln),
-            "size":np.mean([l.size for l in ln]),
-            "bold":any(l.bold for l in ln)
-        })
-    return out
-
 def detect_sections(lines, gap_thresh=25, size_jump=1.4):
     sections=[]; curr=[]; last=None
     for i,l in enumerate(lines):
@@ -125,11 +82,11 @@ def detect_sections(lines, gap_thresh=25, size_jump=1.4):
                 if gap>gap_thresh: new=True
                 elif last["size"] > 0 and l["size"] > 0 and l["size"]/last["size"]>size_jump: new=True
         
-        if re.match(r"^\d+\.|^[A-Z].*?:", l["text"]) or l["bold"]:
+        if SECTION_START_RE.match(l["text"]) or l["bold"]:
             if last and not new:
                 new=True
         
-        if last and re.search(r"\bMarks?\b", last["text"], re.I):
+        if last and MARKS_RE.search(last["text"]):
             new=True
 
         if new and curr:
@@ -173,7 +130,8 @@ def detect_sections(lines, gap_thresh=25, size_jump=1.4):
         })
     return sections
 
-if 'df' in locals() and not df.empty:
+def find_sections(df):
+    """Merged lines -> logical sections, with plain Python field types."""
     lines = group_lines(df)
     print(f"{len(lines)} merged text lines found.")
     sections = detect_sections(lines)
@@ -186,119 +144,74 @@ if 'df' in locals() and not df.empty:
         s["text"] = str(s["text"])
         s["bold"] = bool(s["bold"])
         s["size"] = float(s["size"])
+    return sections
 
-    # Visualisation
-    pdf_out = f"{filename.replace('.pdf', '')}_sections.pdf"
-    if os.path.exists(pdf_path):
-        doc_vis = fitz.open(pdf_path)
-        for s in sections:
-            rect = fitz.Rect(s["bbox"])
-            if s["page_start"] <= len(doc_vis):
-                page = doc_vis[s["page_start"] - 1]
-                page.draw_rect(rect, color=(1, 0, 0), width=1.3)
-        doc_vis.save(pdf_out)
-        doc_vis.close()
-        print(f"✅ Section visualization saved → {pdf_out}")
-else:
-    print("Skipping section detection.")
+def save_section_visualization(sections, pdf_path, pdf_out):
+    """Copy of the PDF with every detected section outlined in red."""
+    if not os.path.exists(pdf_path):
+        return
+    doc_vis = fitz.open(pdf_path)
+    for s in sections:
+        rect = fitz.Rect(s["bbox"])
+        if s["page_start"] <= len(doc_vis):
+            page = doc_vis[s["page_start"] - 1]
+            page.draw_rect(rect, color=(1, 0, 0), width=1.3)
+    doc_vis.save(pdf_out)
+    doc_vis.close()
+    print(f"✅ Section visualization saved → {pdf_out}")
 
 # ==========================================
 # 4. NOUGAT PROCESSING
 # ==========================================
 
-def cleanup_mmd(mmd_text):
-    if not isinstance(mmd_text, str): return ""
-    latex = mmd_text.replace("$$", "\n\\[\n")
-    latex = latex.replace("$", "\\(")
-    latex = latex.replace("\\(\n\\[\n", "\\[")
-    latex = latex.replace("\\]\n\\)", "\\]")
-    return latex.strip()
-
-def parse_sections_with_nougat(sections_list, original_pdf_path):
-    print(f"Starting Nougat parsing for {len(sections_list)} sections.")
-    
-    # Ensure directories exist
-    temp_pdf_dir = "temp_nougat_pdfs"
-    mmd_dir = "nougat_output"
-    os.makedirs(temp_pdf_dir, exist_ok=True)
-    os.makedirs(mmd_dir, exist_ok=True)
-    
-    doc = fitz.open(original_pdf_path)
-    parsed_sections = []
-
-    for s in tqdm(sections_list):
-        temp_pdf_path = None
-        mmd_path = None
-        try:
-            page = doc[s["page_start"] - 1]
-            rect = fitz.Rect(s["bbox"])
-            page_width = page.rect.width
-            clip_rect = fitz.Rect(0, rect.y0, page_width, rect.y1)
-
-            temp_pdf_path = os.path.join(temp_pdf_dir, f"section_{s['id']}.pdf")
-            mmd_path = os.path.join(mmd_dir, f"section_{s['id']}.mmd")
-
-            temp_doc = fitz.open()
-            temp_page = temp_doc.new_page(width=clip_rect.width, height=clip_rect.height)
-            temp_page.show_pdf_page(temp_page.rect, doc, page.number, clip=clip_rect)
-            temp_doc.save(temp_pdf_path)
-            temp_doc.close()
-
-            # Run Nougat
-            # Added check to ensure we don't crash if nougat isn't installed
-            try:
-                env = os.environ.copy()
-                if device == "cuda":
-                    env["CUDA_VISIBLE_DEVICES"] = "0"
-                
-                subprocess.run(
-                    ["nougat", temp_pdf_path, "-o", mmd_dir, "--no-skipping"],
-                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-                    check=True,
-                    env=env
-                )
-                nougat_success = True
-            except (FileNotFoundError, subprocess.CalledProcessError):
-                nougat_success = False
-
-            if nougat_success and os.path.exists(mmd_path):
-                with open(mmd_path, "r", encoding="utf-8") as f:
-                    s["latex_content"] = cleanup_mmd(f.read())
-            else:
-                s["latex_content"] = cleanup_mmd(s["text"])
-            
-            parsed_sections.append(s)
-
-        except Exception as e:
-            # If Nougat fails or isn't installed, fall back to simple text
-            s["latex_content"] = cleanup_mmd(s["text"])
-            parsed_sections.append(s)
-        finally:
-            if temp_pdf_path and os.path.exists(temp_pdf_path): os.remove(temp_pdf_path)
-            if mmd_path and os.path.exists(mmd_path): os.remove(mmd_path)
-
-    doc.close()
-    return parsed_sections
-
-if 'sections' in locals() and len(sections) > 0 and os.path.exists(pdf_path):
-    sections_with_latex = parse_sections_with_nougat(sections, pdf_path)
-    df_intermediate = pd.DataFrame(sections_with_latex)
-else:
-    if 'sections' in locals() and len(sections) > 0:
-         # Fallback if PDF path issue but sections exist
-         df_intermediate = pd.DataFrame(sections)
-         df_intermediate['latex_content'] = df_intermediate['text']
-    else:
-        df_intermediate = pd.DataFrame()
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_nougat_engine(device="cpu"):
+    """One NougatEngine per device, so a process extracting many PDFs loads the model once."""
+    with _engines_lock:
+        if device not in _engines:
+            _engines[device] = NougatEngine(device=device)
+        return _engines[device]
+
+def sections_to_blocks(sections, pdf_path, device="cpu"):
+    """Sections with their Nougat LaTeX as one DataFrame row per block."""
+    if sections and os.path.exists(pdf_path):
+        return pd.DataFrame(parse_sections_with_nougat(sections, pdf_path, get_nougat_engine(device)))
+    if sections:
+        # Fallback if PDF path issue but sections exist
+        df_intermediate = pd.DataFrame(sections)
+        df_intermediate['latex_content'] = df_intermediate['text']
+        return df_intermediate
+    return pd.DataFrame()
+
+def extract_blocks(pdf_path, device=None, visualize=True, vis_dir="."):
+    """
+    PDF -> blocks ready for classification: spans, sections, optional
+    <name>_sections.pdf visualization in vis_dir, then Nougat LaTeX.
+    Columns: id, page_start, page_end, bbox, text, bold, size, latex_content.
+    """
+    df = load_spans(pdf_path)
+    if df.empty:
+        print("Skipping section detection.")
+        return pd.DataFrame()
+    sections = find_sections(df)
+    if visualize:
+        pdf_out = os.path.join(vis_dir, f"{os.path.basename(pdf_path).replace('.pdf', '')}_sections.pdf")
+        save_section_visualization(sections, pdf_path, pdf_out)
+    df_blocks = sections_to_blocks(sections, pdf_path, device or detect_device())
+    print(ocr_cache.report())
+    return df_blocks
 
 # ==========================================
 # 5. AWS BEDROCK INTEGRATION (Using Llama 3)
 # ==========================================
 
-print("\n=== Initializing AWS Bedrock ===")
-
 def get_bedrock_client():
+    load_env_file()
     try:
+        import boto3
+
         return boto3.client(service_name="bedrock-runtime", region_name=BEDROCK_REGION)
     except Exception as e:
         print(f"❌ Failed to initialize Bedrock client: {e}")
@@ -317,14 +230,22 @@ def format_llama3_prompt(user_message: str, system_message: str) -> str:
     )
     return formatted
 
-# --- RETRY LOGIC / EXPONENTIAL BACKOFF ---
+# --- RETRY LOGIC / ADAPTIVE RATE LIMITING ---
 def invoke_bedrock_with_backoff(client, body, model_id, max_attempts=8):
     """
-    Invokes Bedrock with a retry loop to handle ThrottlingExceptions.
+    Invokes Bedrock through the shared AIMD rate limiter.
+    A ThrottlingException lowers the shared rate; the next acquire() paces the retry.
+    Responses are served from / stored in the on-disk LLM cache.
     """
-    delay = 1.0 # Initial delay in seconds
-    
+    from botocore.exceptions import ClientError
+
+    key = llm_cache.make_key(model_id, body)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return {"body": io.BytesIO(cached.encode("utf-8"))}
+
     for attempt in range(max_attempts):
+        bedrock_limiter.acquire()
         try:
             response = client.invoke_model(
                 body=json.dumps(body), 
@@ -332,6 +253,10 @@ def invoke_bedrock_with_backoff(client, body, model_id, max_attempts=8):
                 contentType="application/json",
                 accept="application/json"
             )
+            bedrock_limiter.on_success()
+            raw = response["body"].read()
+            llm_cache.put(key, raw.decode("utf-8"))
+            response["body"] = io.BytesIO(raw)
             return response
             
         except ClientError as e:
@@ -339,15 +264,11 @@ def invoke_bedrock_with_backoff(client, body, model_id, max_attempts=8):
             
             # Check for Throttling
             if error_code == 'ThrottlingException':
+                bedrock_limiter.on_throttle()
                 if attempt == max_attempts - 1:
                     print(f"❌ Bedrock Throttling: Max retries ({max_attempts}) reached.")
                     raise e
-                
-                # Exponential Backoff + Jitter
-                sleep_time = delay + random.uniform(0, 0.5)
-                # Optional: print(f"⚠️ Throttled. Retrying in {sleep_time:.2f}s... (Attempt {attempt+1}/{max_attempts})")
-                time.sleep(sleep_time)
-                delay *= 2 
+                # Optional: print(f"⚠️ Throttled. Rate lowered to {bedrock_limiter.rate:.2f} req/s (Attempt {attempt+1}/{max_attempts})")
             else:
                 # If it's another error (e.g., ValidationException), raise immediately
                 print(f"❌ Bedrock Client Error: {e}")
@@ -399,56 +320,60 @@ def classify_block_with_bedrock(client, text, bold, size):
         # print(f"Final Error classifying block: {e}")
         return "Unclassified"
 
-print("=== Starting AWS Bedrock Classification (Llama 3) ===")
+def preclassify_blocks(df_intermediate, bedrock_client=None):
+    """Adds the per-block Bedrock label as question_start_type."""
+    print("=== Starting AWS Bedrock Classification (Llama 3) ===")
+    if df_intermediate.empty:
+        print("DataFrame empty, skipping Bedrock.")
+        return df_intermediate
 
-if not df_intermediate.empty:
-    bedrock_client = get_bedrock_client()
-    
-    if bedrock_client:
-        # We use tqdm to show progress as API calls take time
-        tqdm.pandas(desc="Classifying with Bedrock")
-        
-        # Apply the function to the DataFrame
-        df_intermediate['question_start_type'] = df_intermediate.progress_apply(
-            lambda row: classify_block_with_bedrock(
-                bedrock_client, 
-                # Use latex_content if available, else raw text. limit chars to save tokens
-                row.get('latex_content', row['text'])[:800], 
-                row['bold'], 
-                row['size']
-            ), axis=1
-        )
-        print("✅ Classification complete.")
-    else:
+    print("\n=== Initializing AWS Bedrock ===")
+    bedrock_client = bedrock_client or get_bedrock_client()
+    if not bedrock_client:
         print("Skipping classification due to client error.")
-else:
-    print("DataFrame empty, skipping Bedrock.")
+        return df_intermediate
+
+    # We use tqdm to show progress as API calls take time
+    tqdm.pandas(desc="Classifying with Bedrock")
+
+    # Apply the function to the DataFrame
+    df_intermediate['question_start_type'] = df_intermediate.progress_apply(
+        lambda row: classify_block_with_bedrock(
+            bedrock_client,
+            # Use latex_content if available, else raw text. limit chars to save tokens
+            row.get('latex_content', row['text'])[:800],
+            row['bold'],
+            row['size']
+        ), axis=1
+    )
+    print("✅ Classification complete.")
+    print(llm_cache.report())
+    return df_intermediate
 
 # ==========================================
 # 6. EXPORT
 # ==========================================
 
-import pickle
+def export_blocks(df_intermediate, export_dir="classifiedBlocksOutput/"):
+    """Writes classified_blocks.parquet (plus .csv with BLOCKS_CSV_EXPORT=1) to export_dir."""
+    print("\n=== Exporting Final Data ===")
 
-print("\n=== Exporting Final Data ===")
+    if df_intermediate.empty:
+        print("No data to export.")
+        return
 
-if not df_intermediate.empty:
     df_to_export = df_intermediate.copy().sort_values(by="id")
-    export_dir = "classifiedBlocksOutput/"
     os.makedirs(export_dir, exist_ok=True)
 
-    # Export to Pickle
-    pkl_path = os.path.join(export_dir, "classified_blocks.pkl")
-    with open(pkl_path, "wb") as f:
-        pickle.dump(df_to_export, f)
-    
-    # Export to CSV
-    csv_path = os.path.join(export_dir, "qwen_debug_full_outputs.csv")
-    try:
-        df_to_export.to_csv(csv_path, index=False, escapechar='\\')
-        print(f"✅ Saved to: {csv_path}")
-    except Exception as e:
-        print(f"❌ Error saving CSV: {e}")
-    print(df_to_export[['id', 'latex_content', 'question_start_type']].head())
-else:
-    print("No data to export.")
+    path = block_store.save_blocks(df_to_export, os.path.join(export_dir, "classified_blocks"))
+    print(f"✅ Saved to: {path}")
+    if 'question_start_type' in df_to_export:
+        print(df_to_export[['id', 'latex_content', 'question_start_type']].head())
+
+def main():
+    df_intermediate = extract_blocks(pdf_path)
+    df_intermediate = preclassify_blocks(df_intermediate)
+    export_blocks(df_intermediate)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 #!/bin/bash
 set -e  # Exit on any error
 
+# Keep a CSV copy of every Parquet intermediate for inspection
+export BLOCKS_CSV_EXPORT=${BLOCKS_CSV_EXPORT:-1}
+
 echo "==========================="
 echo "GenAI Project: Full Pipeline"
 echo "==========================="
@@ -9,7 +12,7 @@ echo "==========================="
 # 2. Run preclassification.py
 # -----------------------------
 echo "----------------------------------------"
-echo "[1/3] Running preclassification.py ..."
+echo "[1/5] Running preclassification.py ..."
 echo "----------------------------------------"
 python preclassification.py
 
@@ -19,7 +22,7 @@ echo "✓ Output stored in export_for_kaggle/"
 # 3. Run classifyAllBlocks.py
 # -----------------------------
 echo "----------------------------------------"
-echo "[2/3]Running classifyAllBlocks.py ..."
+echo "[2/5]Running classifyAllBlocks.py ..."
 echo "----------------------------------------"
 python classifyAllBlocks.py
 
@@ -30,11 +33,31 @@ echo "✓ Look at qwen_debug_full_outputs.csv"
 # 3. Run extractQuestionFromCsv.py
 # -----------------------------
 echo "----------------------------------------"
-echo "[3/3]Running extractQuestionFromCsv.py ..."
+echo "[3/5]Running extractQuestionFromCsv.py ..."
 echo "----------------------------------------"
 python extractQuestionFromCsv.py
 
 echo "✓ YAML outputs stored in yaml_parsed_questions/"
+
+# -----------------------------
+# 4. Build the RAG index (not checked in; generate_solution.py needs it)
+# -----------------------------
+echo "----------------------------------------"
+echo "[4/5] Running build_rag_index.py ..."
+echo "----------------------------------------"
+python build_rag_index.py
+
+echo "✓ RAG index stored in RAG/faiss_index/"
+
+# -----------------------------
+# 5. Run generate_solution.py
+# -----------------------------
+echo "----------------------------------------"
+echo "[5/5] Running generate_solution.py ..."
+echo "----------------------------------------"
+python generate_solution.py
+
+echo "✓ Solutions written to solution.tex"
 echo ""
 echo "========================================="
 echo "   FULL PIPELINE EXECUTED SUCCESSFULLY"
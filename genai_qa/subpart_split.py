@@ -1,45 +1,47 @@
 import os
 import re
 import json
-import time
-import random
-import boto3
+import threading
 from typing import Dict, Optional
 from pydantic import BaseModel, Field
-env_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Notebook Processing", ".env")
-if os.path.exists(env_file_path):
-    with open(env_file_path, "r", encoding="utf-8") as _f:
-        for _line in _f:
-            _line = _line.strip()
-            if not _line or _line.startswith("#"):
-                continue
-            if "=" in _line:
-                _k, _v = _line.split("=", 1)
-                _v = _v.strip().strip('"').strip("'")
-                os.environ.setdefault(_k.strip(), _v)
-    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+from rate_limiter import bedrock_limiter
+from llm_cache import llm_cache
+from env_file import load_env_file
 
 # ==========================================
 # 1. AWS Bedrock Client Setup
 # ==========================================
 
-bedrock = boto3.client(
-    "bedrock-runtime",
-    region_name=os.getenv("BEDROCK_REGION", "us-east-1"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
-)
+_bedrock = None
+_bedrock_lock = threading.Lock()
+
+def get_bedrock():
+    """Bedrock runtime client, created (after loading .env) on the first call."""
+    global _bedrock
+    with _bedrock_lock:
+        if _bedrock is None:
+            import boto3
+
+            load_env_file()
+            _bedrock = boto3.client(
+                "bedrock-runtime",
+                region_name=os.getenv("BEDROCK_REGION", "us-east-1"),
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                aws_session_token=os.getenv("AWS_SESSION_TOKEN"),
+            )
+    return _bedrock
 
 # ==========================================
-# 2. Helper: Exponential Backoff
+# 2. Helper: Adaptive Rate Limiting
 # ==========================================
 
 def bedrock_call_with_backoff(model_id: str, body: dict):
     max_attempts = 8
-    delay = 1.0
+    bedrock = get_bedrock()
 
     for attempt in range(max_attempts):
+        bedrock_limiter.acquire()
         try:
             response = bedrock.invoke_model(
                 modelId=model_id,
@@ -47,16 +49,15 @@ def bedrock_call_with_backoff(model_id: str, body: dict):
                 contentType="application/json",
                 accept="application/json",
             )
+            bedrock_limiter.on_success()
             return response
 
         except bedrock.exceptions.ThrottlingException:
+            bedrock_limiter.on_throttle()
             if attempt == max_attempts - 1:
                 raise
 
-            sleep_time = delay + random.uniform(0, 0.5)
-            print(f"⚠️ Throttled. Retrying in {sleep_time:.2f}s...")
-            time.sleep(sleep_time)
-            delay *= 2  # exponential backoff
+            print(f"⚠️ Throttled. Rate lowered to {bedrock_limiter.rate:.2f} req/s...")
 
         except Exception as e:
             if "ValidationException" in str(e):
@@ -93,9 +94,12 @@ def generate_with_bedrock_llama(prompt_content: str, model_id: str):
         "top_p": 0.9,
     }
 
-    response = bedrock_call_with_backoff(model_id, body)
-    data = json.loads(response["body"].read())
-    return data["generation"]
+    def _call():
+        response = bedrock_call_with_backoff(model_id, body)
+        data = json.loads(response["body"].read())
+        return data["generation"]
+
+    return llm_cache.cached(model_id, body, _call)
 
 # ==========================================
 # 4. Data Models (Pydantic)